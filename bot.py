@@ -1,38 +1,55 @@
 import os
+import ast
+import operator
+import atexit
 import logging
+import logging.handlers
 import re
+import sys
 import math
-import json
+import time
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional, Any
+import functools
+import queue
+import threading
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, List, Mapping, Sequence, Set, Tuple, Optional, Any
 import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from enum import Enum
 from dataclasses import dataclass
+from types import MappingProxyType
 
-from telegram import (
-    Update, 
-    ReplyKeyboardMarkup, 
-    InlineKeyboardMarkup, 
-    InlineKeyboardButton,
-    InputFile
-)
+from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, filters, ContextTypes, 
-    ConversationHandler, CallbackQueryHandler, JobQueue
+    ConversationHandler, AIORateLimiter, PicklePersistence, PersistenceInput
 )
 from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
+
+try:
+    import uvloop  # Ускоренный цикл событий (нет сборок для Windows)
+except ImportError:
+    uvloop = None
 
-# Настройка расширенного логирования
+# Настройка расширенного логирования: обработчики только ставят записи в очередь,
+# запись в файл и консоль выполняет фоновый поток
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('converter_bot_advanced.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
+)
+log_listener = logging.handlers.QueueListener(
+    log_queue,
+    logging.FileHandler('converter_bot_advanced.log', encoding='utf-8'),
+    logging.StreamHandler()
 )
+log_listener.start()
+atexit.register(log_listener.stop)  # дописываем оставшиеся записи при выходе
 logger = logging.getLogger(__name__)
 
 # Получаем токен из переменных окружения
@@ -59,9 +76,30 @@ class BotConfig:
     MAX_HISTORY = 100
     CACHE_DURATION = 3600  # 1 час
     SESSION_TIMEOUT = 300  # 5 минут
+    SESSION_IDLE_TTL = 900  # секунд бездействия, после которых сессия пользователя удаляется
+    SESSION_SWEEP_INTERVAL = 900  # секунд между проходами очистки сессий
+    MAX_SESSIONS = 10000  # сессий пользователей в памяти и в файле сессий
+    PERSISTENCE_PATH = 'converter_bot_sessions.pickle'  # сессии и состояния диалогов между перезапусками
+    PERSISTENCE_INTERVAL = 60  # секунд между записями накопленных изменений сессий на диск
     RATE_LIMIT = 10  # сообщений в минуту
+    TELEGRAM_MAX_RATE = 30  # исходящих запросов в секунду (общий лимит Telegram)
+    RATE_LIMIT_RETRIES = 1  # повторов запроса после ответа RetryAfter
+    HTTP_VERSION = "2"  # HTTP/2 для запросов к Bot API: ответы идут по одному соединению
+    CONVERSION_CACHE_SIZE = 1024  # запомненных результатов конвертации
+    FORMAT_CACHE_SIZE = 4096  # запомненных отформатированных чисел
+    DB_PATH = 'converter_bot_advanced.db'
+    DB_POOL_SIZE = 4  # постоянных подключений к БД
+    DB_STATEMENT_CACHE = 64  # подготовленных выражений на подключение
+    DB_PAGE_CACHE_KIB = 65536  # кэш страниц SQLite на подключение (64 МБ, выделяется по мере чтения)
+    DB_CACHE_SIZE = 1024  # пользователей в кэше избранного и статистики
+    FAVORITES_FLUSH_DELAY = 0.05  # секунд накопления избранного перед записью
+    FAVORITES_BATCH_SIZE = 100  # избранных конвертаций в одной транзакции
+    HISTORY_FLUSH_DELAY = 0.05  # секунд накопления истории перед записью
+    HISTORY_BATCH_SIZE = 64  # записей истории в одной транзакции
+    CLEANUP_CHUNK_SIZE = 5000  # старых записей истории, удаляемых одной транзакцией
 
-@dataclass
+# Результат конвертации хранится в сессиях, поэтому тоже со слотами; после создания не меняется
+@dataclass(slots=True, frozen=True)
 class ConversionResult:
     value: float
     unit_from: str
@@ -70,11 +108,94 @@ class ConversionResult:
     category: str
     timestamp: datetime
 
+# Состояние пользователя между сообщениями: один объект со слотами вместо словаря
+@dataclass(slots=True)
+class UserSession:
+    last_activity: float  # time.time() последнего действия (переживает перезапуск)
+    conversion_count: int = 0
+    category: Optional[str] = None
+    unit_from: Optional[str] = None
+    unit_to: Optional[str] = None
+    last_conversion: Optional[ConversionResult] = None
+
+# Специальные константы, доступные при вводе значения
+INPUT_CONSTANTS = {
+    'pi': math.pi, 'π': math.pi,
+    'e': math.e,
+    'phi': 1.6180339887, 'φ': 1.6180339887,
+    'c': 299792458,  # скорость света
+    'g': 9.80665,    # ускорение свободного падения
+}
+
+# Константа, число или простая дробь (после замены запятой на точку) разбираются
+# одним совпадением; остальной ввод идет в разбор выражений
+INPUT_RE = re.compile(
+    r'(?:(' + '|'.join(map(re.escape, INPUT_CONSTANTS)) + r')|(-?\d+(?:\.\d+)?)(?:/(-?\d+(?:\.\d+)?))?)\Z',
+    re.IGNORECASE
+)
+
+# Функции и константы, разрешенные в выражениях ввода
+EXPRESSION_FUNCTIONS = MappingProxyType({
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "sqrt": math.sqrt, "log": math.log, "log10": math.log10,
+    "exp": math.exp
+})
+EXPRESSION_CONSTANTS = MappingProxyType({"pi": math.pi, "e": math.e})
+
+def _float_pow(base, exponent) -> float:
+    """Возведение в степень во float: вложенные степени не строят огромные целые"""
+    if base == 0 and exponent < 0:
+        raise ZeroDivisionError("0 в отрицательной степени")
+    return math.pow(base, exponent)  # OverflowError сразу, без долгого вычисления
+
+# Разрешенные операторы выражений
+EXPRESSION_BINARY_OPERATORS = MappingProxyType({
+    ast.Add: operator.add, ast.Sub: operator.sub,
+    ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.Pow: _float_pow
+})
+EXPRESSION_UNARY_OPERATORS = MappingProxyType({ast.UAdd: operator.pos, ast.USub: operator.neg})
+
+def _evaluate_node(node: ast.AST):
+    """Вычисление узла выражения только из разрешенных элементов"""
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in EXPRESSION_BINARY_OPERATORS:
+        return EXPRESSION_BINARY_OPERATORS[type(node.op)](_evaluate_node(node.left),
+                                                          _evaluate_node(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in EXPRESSION_UNARY_OPERATORS:
+        return EXPRESSION_UNARY_OPERATORS[type(node.op)](_evaluate_node(node.operand))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in EXPRESSION_FUNCTIONS and not node.keywords):
+        return EXPRESSION_FUNCTIONS[node.func.id](*map(_evaluate_node, node.args))
+    if isinstance(node, ast.Name) and node.id in EXPRESSION_CONSTANTS:
+        return EXPRESSION_CONSTANTS[node.id]
+    raise ValueError("Недопустимый элемент выражения")
+
+@functools.lru_cache(maxsize=512)
+def evaluate_expression(expression: str):
+    """Безопасное вычисление арифметического выражения без eval"""
+    return _evaluate_node(ast.parse(expression, mode="eval").body)
+
+# Признак выражения: арифметический оператор, дробь или вызов функции
+EXPRESSION_RE = re.compile(r'[-+*^/(]')
+
+# Ведущий ноль порядка в научной нотации: 1.5e-07 -> 1.5e-7
+EXPONENT_RE = re.compile(r'e([+-])0(?=\d)')
+
+def _intern_units(quantities: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Интернирование названий категорий и единиц для быстрых сравнений ключей"""
+    return {
+        sys.intern(category): {sys.intern(unit): data for unit, data in units.items()}
+        for category, units in quantities.items()
+    }
+
 class EnhancedUnitConverter:
     """Усовершенствованный конвертер с поддержкой древнерусских мер"""
     
-    # Расширенная база единиц измерения
-    PHYSICAL_QUANTITIES = {
+    # Расширенная база единиц измерения (только для чтения)
+    PHYSICAL_QUANTITIES = MappingProxyType(_intern_units({
         "Длина": {
             "метр (м)": {"factor": 1.0, "type": "linear"},
             "километр (км)": {"factor": 1000.0, "type": "linear"},
@@ -126,11 +247,11 @@ class EnhancedUnitConverter:
             "век": {"factor": 3.15576e9, "type": "linear"}
         },
         "Температура": {
-            "Цельсий (°C)": {"type": "temperature"},
-            "Фаренгейт (°F)": {"type": "temperature"},
-            "Кельвин (K)": {"type": "temperature"},
-            "Ранкин (°R)": {"type": "temperature"},
-            "Реомюр (°Ré)": {"type": "temperature"}
+            "Цельсий (°C)": {"type": "temperature", "scale": "celsius"},
+            "Фаренгейт (°F)": {"type": "temperature", "scale": "fahrenheit"},
+            "Кельвин (K)": {"type": "temperature", "scale": "kelvin"},
+            "Ранкин (°R)": {"type": "temperature", "scale": "rankine"},
+            "Реомюр (°Ré)": {"type": "temperature", "scale": "reaumur"}
         },
         "Площадь": {
             "кв. метр (м²)": {"factor": 1.0, "type": "area"},
@@ -268,62 +389,40 @@ class EnhancedUnitConverter:
             "сантипуаз (сП)": {"factor": 0.001, "type": "linear"},
             "пуаз (П)": {"factor": 0.1, "type": "linear"}
         }
-    }
+    }))
 
-    # Формулы для сложных преобразований
-    FORMULAS = {
-        "температура": {
-            "Цельсий (°C)": {
-                "Фаренгейт (°F)": lambda x: (x * 9/5) + 32,
-                "Кельвин (K)": lambda x: x + 273.15,
-                "Ранкин (°R)": lambda x: (x + 273.15) * 9/5,
-                "Реомюр (°Ré)": lambda x: x * 4/5
-            },
-            "Фаренгейт (°F)": {
-                "Цельсий (°C)": lambda x: (x - 32) * 5/9,
-                "Кельвин (K)": lambda x: (x + 459.67) * 5/9,
-                "Ранкин (°R)": lambda x: x + 459.67,
-                "Реомюр (°Ré)": lambda x: (x - 32) * 4/9
-            },
-            "Кельвин (K)": {
-                "Цельсий (°C)": lambda x: x - 273.15,
-                "Фаренгейт (°F)": lambda x: (x * 9/5) - 459.67,
-                "Ранкин (°R)": lambda x: x * 9/5,
-                "Реомюр (°Ré)": lambda x: (x - 273.15) * 4/5
-            }
-        }
+    # Коэффициенты шкал относительно Цельсия: °C = (значение - сдвиг) * числитель / знаменатель
+    TEMPERATURE_SCALES = {
+        "celsius": (0.0, 1, 1),
+        "fahrenheit": (32.0, 5, 9),
+        "kelvin": (273.15, 1, 1),
+        "rankine": (491.67, 5, 9),
+        "reaumur": (0.0, 5, 4)
     }
+    ABSOLUTE_ZERO_C = -273.15
+    ABSOLUTE_ZERO_TOLERANCE = 1e-9  # погрешность пересчета шкал: -218.52 °Ré дает -273.15000000000003 °C
+
+    # Категории, единицы которых можно конвертировать между собой
+    COMPATIBLE_CATEGORIES = MappingProxyType({
+        "Длина": ("Длина", "Древнерусские меры длины"),
+        "Древнерусские меры длины": ("Длина", "Древнерусские меры длины"),
+    })
 
     @classmethod
-    def get_compatible_categories(cls, category: str) -> List[str]:
+    def get_compatible_categories(cls, category: str) -> Sequence[str]:
         """Получить список совместимых категорий"""
-        compatible = {
-            "Длина": ["Длина", "Древнерусские меры длины"],
-            "Древнерусские меры длины": ["Длина", "Древнерусские меры длины"],
-        }
-        
         # По умолчанию категория совместима только сама с собой
-        return compatible.get(category, [category])
+        return cls.COMPATIBLE_CATEGORIES.get(category, (category,))
 
-    @classmethod
-    def get_compatible_units(cls, category: str) -> Dict[str, Any]:
+    @staticmethod
+    def get_compatible_units(category: str) -> Mapping[str, Any]:
         """Получить все совместимые единицы измерения"""
-        compatible_categories = cls.get_compatible_categories(category)
-        result = {}
-        
-        for cat in compatible_categories:
-            if cat in cls.PHYSICAL_QUANTITIES:
-                result.update(cls.PHYSICAL_QUANTITIES[cat])
-        
-        return result
+        return COMPATIBLE_UNITS.get(category, MappingProxyType({}))
 
     @classmethod
     def find_unit_category(cls, unit_name: str) -> Optional[str]:
         """Найти категорию для единицы измерения"""
-        for category, units in cls.PHYSICAL_QUANTITIES.items():
-            if unit_name in units:
-                return category
-        return None
+        return UNIT_TO_CATEGORY.get(unit_name)
 
     @classmethod
     def convert_temperature(cls, value: float, from_unit: str, to_unit: str) -> float:
@@ -331,60 +430,45 @@ class EnhancedUnitConverter:
         if from_unit == to_unit:
             return value
         
-        # Проверяем наличие формулы
-        for base_unit, conversions in cls.FORMULAS["температура"].items():
-            if base_unit in from_unit and to_unit in conversions:
-                return conversions[to_unit](value)
-        
-        # Если нет прямой формулы, используем Цельсий как промежуточную
-        if "Цельсий" not in from_unit:
-            # Конвертируем в Цельсий
-            if "Фаренгейт" in from_unit:
-                celsius = (value - 32) * 5/9
-            elif "Кельвин" in from_unit:
-                celsius = value - 273.15
-            elif "Ранкин" in from_unit:
-                celsius = (value - 491.67) * 5/9
-            elif "Реомюр" in from_unit:
-                celsius = value * 5/4
-            else:
-                raise ValueError(f"Неизвестная единица температуры: {from_unit}")
-        else:
-            celsius = value
-        
-        # Конвертируем из Цельсия в целевую единицу
-        if "Фаренгейт" in to_unit:
-            return (celsius * 9/5) + 32
-        elif "Кельвин" in to_unit:
-            return celsius + 273.15
-        elif "Ранкин" in to_unit:
-            return (celsius + 273.15) * 9/5
-        elif "Реомюр" in to_unit:
-            return celsius * 4/5
-        else:
+        units = cls.PHYSICAL_QUANTITIES["Температура"]
+        scale_from = units.get(from_unit, {}).get("scale")
+        if scale_from is None:
+            raise ValueError(f"Неизвестная единица температуры: {from_unit}")
+        scale_to = units.get(to_unit, {}).get("scale")
+        if scale_to is None:
             raise ValueError(f"Неизвестная единица температуры: {to_unit}")
+        
+        # Пересчет через Цельсий по таблице коэффициентов вместо ветвления по шкалам
+        offset, num, den = cls.TEMPERATURE_SCALES[scale_from]
+        celsius = (value - offset) * num / den
+        if celsius < cls.ABSOLUTE_ZERO_C - cls.ABSOLUTE_ZERO_TOLERANCE:
+            raise ValueError("Температура ниже абсолютного нуля")
+        celsius = max(celsius, cls.ABSOLUTE_ZERO_C)
+        if scale_from == scale_to:
+            return value
+        offset, num, den = cls.TEMPERATURE_SCALES[scale_to]
+        return celsius * den / num + offset
 
     @classmethod
+    @functools.lru_cache(maxsize=BotConfig.CONVERSION_CACHE_SIZE)
     def convert_standard(cls, value: float, from_unit: str, to_unit: str, category: str) -> float:
-        """Конвертация стандартных величин с поддержкой древнерусских мер"""
-        # Получаем ВСЕ совместимые единицы для категории
-        compatible_units = cls.get_compatible_units(category)
-        
-        if from_unit not in compatible_units or to_unit not in compatible_units:
-            raise ValueError(f"Неизвестные единицы измерения: {from_unit} -> {to_unit}")
+        """Конвертация стандартных величин с поддержкой древнерусских мер
         
-        from_data = compatible_units[from_unit]
-        to_data = compatible_units[to_unit]
+        Результаты запоминаются: повторные конвертации тех же значений
+        (например, быстрые конвертации) сводятся к одному поиску в кэше.
+        """
+        # Стандартная линейная конвертация: один множитель для пары единиц
+        pair_factor = PAIR_FACTOR.get(category, {}).get((from_unit, to_unit))
+        if pair_factor is not None:
+            return value * pair_factor
         
         # Для температур используем специальный метод
-        if from_data.get("type") == "temperature" or to_data.get("type") == "temperature":
+        units = cls.PHYSICAL_QUANTITIES.get(category, {})
+        if (units.get(from_unit, {}).get("type") == "temperature"
+                and units.get(to_unit, {}).get("type") == "temperature"):
             return cls.convert_temperature(value, from_unit, to_unit)
         
-        # Стандартная линейная конвертация
-        from_factor = from_data["factor"]
-        to_factor = to_data["factor"]
-        
-        return value * from_factor / to_factor
+        raise ValueError(f"Неизвестные единицы измерения: {from_unit} -> {to_unit}")
 
     @classmethod
     def universal_convert(cls, value: float, from_unit: str, to_unit: str) -> float:
@@ -403,8 +487,9 @@ class EnhancedUnitConverter:
         return cls.convert_standard(value, from_unit, to_unit, from_category)
 
     @staticmethod
+    @functools.lru_cache(maxsize=BotConfig.FORMAT_CACHE_SIZE)
     def format_result(value: float, precision: int = 8) -> str:
-        """Умное форматирование результата"""
+        """Умное форматирование результата (повторные значения берутся из кэша)"""
         if value == 0:
             return "0"
         
@@ -412,7 +497,7 @@ class EnhancedUnitConverter:
         
         # Для очень больших или очень маленьких чисел используем научную нотацию
         if abs_value < 1e-6 or abs_value > 1e12:
-            return f"{value:.{precision}e}".replace('e-0', 'e-').replace('e+0', 'e+')
+            return EXPONENT_RE.sub(r'e\1', f"{value:.{precision}e}", count=1)
         
         # Определяем оптимальное количество знаков после запятой
         if abs_value < 0.001:
@@ -424,127 +509,327 @@ class EnhancedUnitConverter:
         else:
             decimals = 2
         
-        formatted = f"{value:.{decimals}f}".rstrip('0').rstrip('.')
-        
-        # Добавляем разделители тысяч для больших чисел
-        if '.' in formatted:
-            int_part, dec_part = formatted.split('.')
-        else:
-            int_part, dec_part = formatted, ""
-        
-        if len(int_part) > 3:
-            int_part = f"{int(int_part):,}".replace(',', ' ')
-        
-        return f"{int_part}.{dec_part}" if dec_part else int_part
+        # Разделители тысяч ставит сам спецификатор формата, пробелы вместо запятых
+        formatted = f"{value:,.{decimals}f}".rstrip('0').rstrip('.')
+        return formatted.replace(',', ' ')
 
+    @staticmethod
+    def _check_range(value: float) -> Tuple[bool, Optional[float], Optional[str]]:
+        """Проверка введенного числа на разумные пределы"""
+        if abs(value) > 1e100:
+            return False, None, "❌ Слишком большое число"
+        if abs(value) < 1e-100 and value != 0:
+            return False, None, "❌ Слишком маленькое число"
+        return True, value, None
+    
     @staticmethod
     def validate_input(text: str) -> Tuple[bool, Optional[float], Optional[str]]:
         """Расширенная валидация ввода с поддержкой формул"""
         try:
             cleaned = text.strip().replace(',', '.').replace(' ', '')
             
-            # Специальные константы
-            constants = {
-                'pi': math.pi, 'π': math.pi,
-                'e': math.e,
-                'phi': 1.6180339887, 'φ': 1.6180339887,
-                'c': 299792458,  # скорость света
-                'g': 9.80665,    # ускорение свободного падения
-            }
-            
-            if cleaned.lower() in constants:
-                return True, constants[cleaned.lower()], None
-            
-            # Поддержка дробей
-            if '/' in cleaned:
-                parts = cleaned.split('/')
-                if len(parts) == 2:
-                    numerator = float(parts[0])
-                    denominator = float(parts[1])
+            # Быстрый путь для константы, числа или дроби без разбора выражений
+            match = INPUT_RE.match(cleaned)
+            if match:
+                constant, number, denominator = match.groups()
+                if constant:
+                    return True, INPUT_CONSTANTS[constant.lower()], None
+                value = float(number)
+                if denominator is not None:
+                    denominator = float(denominator)
                     if denominator == 0:
                         return False, None, "❌ Деление на ноль невозможно"
-                    return True, numerator / denominator, None
+                    value /= denominator
+                return EnhancedUnitConverter._check_range(value)
             
-            # Поддержка простых математических выражений
-            if any(op in cleaned for op in ['+', '-', '*', '^']):
+            # Поддержка дробей и математических выражений: один проход регулярным выражением
+            if EXPRESSION_RE.search(cleaned):
                 # Заменяем ^ на ** для возведения в степень
                 cleaned = cleaned.replace('^', '**')
                 # Безопасное вычисление выражения
                 try:
-                    result = eval(cleaned, {"__builtins__": None}, {
-                        "sin": math.sin, "cos": math.cos, "tan": math.tan,
-                        "sqrt": math.sqrt, "log": math.log, "log10": math.log10,
-                        "exp": math.exp, "pi": math.pi, "e": math.e
-                    })
-                    if isinstance(result, (int, float)):
-                        return True, float(result), None
-                except:
+                    result = evaluate_expression(cleaned)
+                    if isinstance(result, (int, float)) and math.isfinite(result):
+                        return EnhancedUnitConverter._check_range(float(result))
+                except ZeroDivisionError:
+                    return False, None, "❌ Деление на ноль невозможно"
+                except Exception:
                     pass
             
             # Простое число
-            value = float(cleaned)
-            
-            # Проверка на разумные пределы
-            if abs(value) > 1e100:
-                return False, None, "❌ Слишком большое число"
-            if abs(value) < 1e-100 and value != 0:
-                return False, None, "❌ Слишком маленькое число"
-            
-            return True, value, None
+            return EnhancedUnitConverter._check_range(float(cleaned))
             
         except ValueError:
             return False, None, "❌ Пожалуйста, введите корректное числовое значение\nПример: 10, 15.5, 1/2, -40, 0.25, pi, sin(30), 2^8"
 
+# Объединенные единицы всех совместимых категорий, собранные один раз при загрузке
+COMPATIBLE_UNITS: Dict[str, Mapping[str, Any]] = {
+    category: MappingProxyType({
+        unit: data
+        for compatible in EnhancedUnitConverter.get_compatible_categories(category)
+        for unit, data in EnhancedUnitConverter.PHYSICAL_QUANTITIES.get(compatible, {}).items()
+    })
+    for category in EnhancedUnitConverter.PHYSICAL_QUANTITIES
+}
+
+# Предвычисленные таблицы линейной конвертации для каждой категории:
+# индекс единицы {название: i} и кортеж коэффициентов, доступный по этому индексу
+_LINEAR_UNITS = {
+    category: {
+        unit: data["factor"]
+        for unit, data in EnhancedUnitConverter.get_compatible_units(category).items()
+        if "factor" in data
+    }
+    for category in EnhancedUnitConverter.PHYSICAL_QUANTITIES
+}
+UNIT_INDEX: Dict[str, Dict[str, int]] = {
+    category: {unit: i for i, unit in enumerate(units)}
+    for category, units in _LINEAR_UNITS.items() if units
+}
+FACTORS: Dict[str, Tuple[float, ...]] = {
+    category: tuple(float(factor) for factor in units.values())
+    for category, units in _LINEAR_UNITS.items() if units
+}
+# Множители для всех пар единиц категории: value * PAIR_FACTOR[cat][(from, to)]
+PAIR_FACTOR: Dict[str, Dict[Tuple[str, str], float]] = {
+    category: {
+        (unit_from, unit_to): FACTORS[category][i_from] / FACTORS[category][i_to]
+        for unit_from, i_from in unit_index.items()
+        for unit_to, i_to in unit_index.items()
+    }
+    for category, unit_index in UNIT_INDEX.items()
+}
+
+# Обратный индекс {единица: категория}; при повторе названия остается первая категория
+UNIT_TO_CATEGORY: Dict[str, str] = {}
+for _category, _units in EnhancedUnitConverter.PHYSICAL_QUANTITIES.items():
+    for _unit in _units:
+        UNIT_TO_CATEGORY.setdefault(_unit, _category)
+
+class LRUCache:
+    """Потокобезопасный кэш с вытеснением давно неиспользованных записей"""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        # Сбросы нумеруются по порядку: чтение из БД, начавшееся до сброса ключа,
+        # не кладет в кэш устаревшее значение
+        self._reset_count = 0
+        self._resets: OrderedDict = OrderedDict()  # ключ -> номер последнего сброса
+        self._forgotten_reset = 0  # наибольший номер сброса, вытесненный из _resets
+    
+    def mark(self) -> int:
+        """Номер последнего сброса; берется перед чтением из базы"""
+        with self._lock:
+            return self._reset_count
+    
+    def get(self, key, default=None):
+        """Получение значения с отметкой об использовании"""
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+    
+    def set(self, key, value, mark: int):
+        """Сохранение значения, если ключ не сбрасывался после mark"""
+        with self._lock:
+            if self._resets.get(key, self._forgotten_reset) > mark:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key):
+        """Сброс записи после изменения данных"""
+        with self._lock:
+            self._data.pop(key, None)
+            self._reset_count += 1
+            self._resets[key] = self._reset_count
+            self._resets.move_to_end(key)
+            if len(self._resets) > self.maxsize:
+                self._forgotten_reset = self._resets.popitem(last=False)[1]
+
+# Признак отсутствия записи в кэше (None — допустимое закэшированное значение)
+_MISSING = object()
+
+# Схема базы: таблицы и индексы создаются одним скриптом при запуске
+SQL_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS user_favorites (
+        user_id INTEGER,
+        favorite_name TEXT,
+        from_unit TEXT,
+        to_unit TEXT,
+        category TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, favorite_name)
+    );
+    
+    CREATE TABLE IF NOT EXISTS conversion_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        from_value REAL,
+        from_unit TEXT,
+        to_value REAL,
+        to_unit TEXT,
+        category TEXT,
+        converted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        conversions_count INTEGER DEFAULT 0,
+        favorites_count INTEGER DEFAULT 0,
+        last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    -- Индексы под выборки по пользователю с сортировкой по времени
+    CREATE INDEX IF NOT EXISTS idx_hist_user_time
+    ON conversion_history (user_id, converted_at DESC);
+    
+    -- Покрывающий индекс для группировки самых частых конвертаций
+    CREATE INDEX IF NOT EXISTS idx_hist_user_units
+    ON conversion_history (user_id, from_unit, to_unit);
+    
+    CREATE INDEX IF NOT EXISTS idx_fav_user_created
+    ON user_favorites (user_id, created_at DESC);
+    
+    -- Счетчики user_stats поддерживаются триггерами в той же транзакции, что и запись.
+    -- Счетчик конвертаций обновляется на месте, не затирая favorites_count и first_seen
+    CREATE TRIGGER IF NOT EXISTS trg_history_stats
+    AFTER INSERT ON conversion_history
+    BEGIN
+        INSERT INTO user_stats (user_id, conversions_count) VALUES (NEW.user_id, 1)
+        ON CONFLICT(user_id) DO UPDATE SET
+            conversions_count = conversions_count + 1,
+            last_activity = CURRENT_TIMESTAMP;
+    END;
+    
+    -- Избранное может записаться раньше первой конвертации пользователя,
+    -- поэтому строка статистики создается и здесь
+    CREATE TRIGGER IF NOT EXISTS trg_favorites_insert_stats
+    AFTER INSERT ON user_favorites
+    BEGIN
+        INSERT INTO user_stats (user_id, favorites_count)
+        VALUES (NEW.user_id, (SELECT COUNT(*) FROM user_favorites WHERE user_id = NEW.user_id))
+        ON CONFLICT(user_id) DO UPDATE SET favorites_count = excluded.favorites_count;
+    END;
+    
+    CREATE TRIGGER IF NOT EXISTS trg_favorites_delete_stats
+    AFTER DELETE ON user_favorites
+    BEGIN
+        UPDATE user_stats
+        SET favorites_count = (SELECT COUNT(*) FROM user_favorites WHERE user_id = OLD.user_id)
+        WHERE user_id = OLD.user_id;
+    END;
+'''
+
+# Запросы к базе: одинаковый текст SQL переиспользует подготовленные выражения
+# из кэша sqlite3 на каждом постоянном подключении пула
+SQL_INSERT_HISTORY = '''
+    INSERT INTO conversion_history
+    (user_id, from_value, from_unit, to_value, to_unit, category)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+SQL_SELECT_FAVORITES = '''
+    SELECT favorite_name, from_unit, to_unit, category
+    FROM user_favorites
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+'''
+
+# Повторное имя не перезаписывает существующее избранное
+SQL_INSERT_FAVORITE = '''
+    INSERT INTO user_favorites
+    (user_id, favorite_name, from_unit, to_unit, category)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, favorite_name) DO NOTHING
+'''
+
+# Время первого входа отдается как unix-время: без разбора строки даты в Python
+SQL_SELECT_STATS = '''
+    SELECT conversions_count, favorites_count, last_activity,
+           CAST(strftime('%s', first_seen) AS INTEGER) AS first_seen
+    FROM user_stats WHERE user_id = ?
+'''
+
+SQL_SELECT_RECENT = '''
+    SELECT from_value, from_unit, to_value, to_unit, category, converted_at
+    FROM conversion_history
+    WHERE user_id = ?
+    ORDER BY converted_at DESC
+    LIMIT ?
+'''
+
+SQL_SELECT_MOST_USED = '''
+    SELECT from_unit, to_unit, COUNT(*) as usage_count
+    FROM conversion_history
+    WHERE user_id = ?
+    GROUP BY from_unit, to_unit
+    ORDER BY usage_count DESC
+    LIMIT ?
+'''
+
+# Старые записи удаляются порциями от самых ранних id, чтобы не держать блокировку записи
+SQL_DELETE_OLD_HISTORY = '''
+    DELETE FROM conversion_history
+    WHERE id IN (
+        SELECT id FROM conversion_history
+        WHERE converted_at < datetime('now', ?)
+        ORDER BY id
+        LIMIT ?
+    )
+'''
+
 class AdvancedDatabaseManager:
     """Усовершенствованный менеджер базы данных"""
     
     def __init__(self):
+        # Подключения открываются один раз и переиспользуются,
+        # чтобы не терять кэш страниц SQLite между запросами
+        self._pool: queue.Queue = queue.Queue()
+        for _ in range(BotConfig.DB_POOL_SIZE):
+            self._pool.put(self._connect())
+        # Избранное и статистика читаются из кэша, пока пользователь их не изменит;
+        # избранное хранится вместе с индексом по названию
+        self._favorites_cache = LRUCache(BotConfig.DB_CACHE_SIZE)
+        self._stats_cache = LRUCache(BotConfig.DB_CACHE_SIZE)
         self.init_database()
     
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        """Открытие и настройка подключения для пула"""
+        conn = sqlite3.connect(
+            BotConfig.DB_PATH, check_same_thread=False,
+            cached_statements=BotConfig.DB_STATEMENT_CACHE
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute(f'PRAGMA cache_size=-{BotConfig.DB_PAGE_CACHE_KIB}')
+        conn.execute('PRAGMA mmap_size=268435456')  # чтение файла БД через mmap (256 МБ)
+        return conn
+    
+    @staticmethod
+    def _named_cursor(conn: sqlite3.Connection) -> sqlite3.Cursor:
+        """Курсор со строками sqlite3.Row для выборок, читаемых по именам столбцов"""
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        return cursor
+    
     def init_database(self):
         """Инициализация расширенной базы данных"""
         with self.get_db_connection() as conn:
-            # Основные таблицы
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS user_favorites (
-                    user_id INTEGER,
-                    favorite_name TEXT,
-                    from_unit TEXT,
-                    to_unit TEXT,
-                    category TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (user_id, favorite_name)
-                )
-            ''')
-            
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS conversion_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    from_value REAL,
-                    from_unit TEXT,
-                    to_value REAL,
-                    to_unit TEXT,
-                    category TEXT,
-                    converted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS user_stats (
-                    user_id INTEGER PRIMARY KEY,
-                    conversions_count INTEGER DEFAULT 0,
-                    favorites_count INTEGER DEFAULT 0,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            conn.executescript(SQL_SCHEMA)
     
     @contextmanager
     def get_db_connection(self):
-        """Контекстный менеджер для подключения к БД"""
-        conn = sqlite3.connect('converter_bot_advanced.db', check_same_thread=False)
-        conn.row_factory = sqlite3.Row
+        """Контекстный менеджер для подключения к БД из пула"""
+        conn = self._pool.get()
         try:
             yield conn
             conn.commit()
@@ -552,117 +837,109 @@ class AdvancedDatabaseManager:
             conn.rollback()
             raise
         finally:
-            conn.close()
+            self._pool.put(conn)
     
     def save_conversion(self, user_id: int, conversion: ConversionResult):
         """Сохранение конвертации в историю"""
-        with self.get_db_connection() as conn:
-            conn.execute('''
-                INSERT INTO conversion_history 
-                (user_id, from_value, from_unit, to_value, to_unit, category)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, conversion.value, conversion.unit_from, 
-                  conversion.result, conversion.unit_to, conversion.category))
-            
-            # Обновляем статистику
-            conn.execute('''
-                INSERT OR REPLACE INTO user_stats 
-                (user_id, conversions_count, last_activity)
-                VALUES (?, 
-                    COALESCE((SELECT conversions_count FROM user_stats WHERE user_id = ?), 0) + 1,
-                    CURRENT_TIMESTAMP)
-            ''', (user_id, user_id))
+        self.save_conversions([(user_id, conversion)])
     
-    def get_user_favorites(self, user_id: int) -> List[Dict]:
-        """Получение избранных конвертаций пользователя"""
+    def save_conversions(self, conversions: List[Tuple[int, ConversionResult]]):
+        """Сохранение пачки конвертаций в историю одной транзакцией"""
+        rows = [(user_id, conversion.value, conversion.unit_from,
+                 conversion.result, conversion.unit_to, conversion.category)
+                for user_id, conversion in conversions]
         with self.get_db_connection() as conn:
-            cursor = conn.execute('''
-                SELECT favorite_name, from_unit, to_unit, category 
-                FROM user_favorites 
-                WHERE user_id = ? 
-                ORDER BY created_at DESC
-            ''', (user_id,))
-            
-            return [dict(row) for row in cursor.fetchall()]
+            conn.executemany(SQL_INSERT_HISTORY, rows)
+        for user_id in {row[0] for row in rows}:
+            self._stats_cache.pop(user_id)
     
-    def save_favorite(self, user_id: int, favorite_name: str, from_unit: str, 
-                     to_unit: str, category: str):
-        """Сохранение избранной конвертации"""
+    def _load_favorites(self, user_id: int) -> Tuple[List[Dict], Dict[str, Dict]]:
+        """Избранное пользователя и индекс по названию (из кэша или из базы)"""
+        cached = self._favorites_cache.get(user_id)
+        if cached is not None:
+            return cached
+        mark = self._favorites_cache.mark()
         with self.get_db_connection() as conn:
-            conn.execute('''
-                INSERT OR REPLACE INTO user_favorites 
-                (user_id, favorite_name, from_unit, to_unit, category)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, favorite_name, from_unit, to_unit, category))
+            cursor = self._named_cursor(conn).execute(SQL_SELECT_FAVORITES, (user_id,))
             
-            # Обновляем счетчик избранного
-            conn.execute('''
-                UPDATE user_stats 
-                SET favorites_count = (
-                    SELECT COUNT(*) FROM user_favorites WHERE user_id = ?
-                )
-                WHERE user_id = ?
-            ''', (user_id, user_id))
+            favorites = [dict(row) for row in cursor.fetchall()]
+        cached = (favorites, {favorite['favorite_name']: favorite for favorite in favorites})
+        self._favorites_cache.set(user_id, cached, mark)
+        return cached
     
-    def delete_favorite(self, user_id: int, favorite_name: str):
-        """Удаление избранной конвертации"""
-        with self.get_db_connection() as conn:
-            conn.execute('''
-                DELETE FROM user_favorites 
-                WHERE user_id = ? AND favorite_name = ?
-            ''', (user_id, favorite_name))
+    def get_user_favorites(self, user_id: int) -> List[Dict]:
+        """Получение избранных конвертаций пользователя"""
+        return self._load_favorites(user_id)[0]
+    
+    def get_user_favorite(self, user_id: int, favorite_name: str) -> Optional[Dict]:
+        """Поиск избранной конвертации по названию"""
+        return self._load_favorites(user_id)[1].get(favorite_name)
     
-    def is_favorite_name_unique(self, user_id: int, favorite_name: str) -> bool:
-        """Проверка уникальности имени избранного"""
+    def save_favorites(self, favorites: List[Tuple[int, str, str, str, str]]):
+        """Сохранение пачки избранных конвертаций одной транзакцией; повторы имен пропускаются"""
+        user_ids = {favorite[0] for favorite in favorites}
         with self.get_db_connection() as conn:
-            cursor = conn.execute('''
-                SELECT 1 FROM user_favorites 
-                WHERE user_id = ? AND favorite_name = ?
-            ''', (user_id, favorite_name))
-            return cursor.fetchone() is None
+            conn.executemany(SQL_INSERT_FAVORITE, favorites)
+        for user_id in user_ids:
+            self._favorites_cache.pop(user_id)
+            self._stats_cache.pop(user_id)
     
     def get_user_stats(self, user_id: int) -> Optional[Dict]:
         """Получение статистики пользователя"""
+        stats = self._stats_cache.get(user_id, _MISSING)
+        if stats is not _MISSING:
+            return stats
+        mark = self._stats_cache.mark()
         with self.get_db_connection() as conn:
-            cursor = conn.execute('''
-                SELECT conversions_count, favorites_count, last_activity, first_seen
-                FROM user_stats WHERE user_id = ?
-            ''', (user_id,))
+            cursor = self._named_cursor(conn).execute(SQL_SELECT_STATS, (user_id,))
             row = cursor.fetchone()
-            return dict(row) if row else None
+            stats = dict(row) if row else None
+        self._stats_cache.set(user_id, stats, mark)
+        return stats
     
     def get_recent_conversions(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Получение последних конвертаций пользователя"""
         with self.get_db_connection() as conn:
-            cursor = conn.execute('''
-                SELECT from_value, from_unit, to_value, to_unit, category, converted_at
-                FROM conversion_history 
-                WHERE user_id = ? 
-                ORDER BY converted_at DESC 
-                LIMIT ?
-            ''', (user_id, limit))
+            cursor = self._named_cursor(conn).execute(SQL_SELECT_RECENT, (user_id, limit))
             return [dict(row) for row in cursor.fetchall()]
     
     def get_most_used_conversions(self, user_id: int, limit: int = 5) -> List[Dict]:
         """Получение самых частых конвертаций"""
         with self.get_db_connection() as conn:
-            cursor = conn.execute('''
-                SELECT from_unit, to_unit, COUNT(*) as usage_count
-                FROM conversion_history 
-                WHERE user_id = ?
-                GROUP BY from_unit, to_unit
-                ORDER BY usage_count DESC
-                LIMIT ?
-            ''', (user_id, limit))
+            cursor = self._named_cursor(conn).execute(SQL_SELECT_MOST_USED, (user_id, limit))
             return [dict(row) for row in cursor.fetchall()]
     
+    def get_user_stats_bundle(self, user_id: int, limit: int = 5) -> Tuple[Optional[Dict], List[Dict]]:
+        """Статистика и самые частые конвертации за один вызов"""
+        stats = self.get_user_stats(user_id)
+        if not stats:
+            return None, []
+        return stats, self.get_most_used_conversions(user_id, limit)
+    
     def cleanup_old_history(self, days: int = 30):
-        """Очистка старой истории"""
+        """Очистка старой истории порциями: между ними успевают пройти другие записи"""
+        chunk_size = BotConfig.CLEANUP_CHUNK_SIZE
         with self.get_db_connection() as conn:
-            conn.execute('''
-                DELETE FROM conversion_history 
-                WHERE converted_at < datetime('now', ?)
-            ''', (f'-{days} days',))
+            while True:
+                deleted = conn.execute(SQL_DELETE_OLD_HISTORY, (f'-{days} days', chunk_size)).rowcount
+                conn.commit()
+                if deleted < chunk_size:
+                    break
+            # Обновляем статистику индексов для планировщика после массового удаления
+            conn.execute("ANALYZE conversion_history")
+
+# Предопределенные быстрые конвертации
+QUICK_CONVERSIONS = {
+    "📏 Дюймы → см": (10, "дюйм (in)", "сантиметр (см)", "Длина"),
+    "⚖️ Фунты → кг": (1, "фунт (lb)", "килограмм (кг)", "Масса"),
+    "🌡️ °F → °C": (32, "Фаренгейт (°F)", "Цельсий (°C)", "Температура"),
+    "💻 Мбит → МБ/с": (100, "мегабит/сек (Mbps)", "мегабайт/сек (MBps)", "Скорость передачи данных"),
+    "🛣️ Мили → км": (1, "миля (mi)", "километр (км)", "Длина"),
+    "📐 Футы → метры": (6, "фут (ft)", "метр (м)", "Длина")
+}
+
+# Надписи кнопок быстрых конвертаций: из них строится клавиатура и маршрутизация текста
+QUICK_CONVERSION_LABELS = tuple(QUICK_CONVERSIONS)
 
 class InteractiveKeyboardManager:
     """Менеджер интерактивных клавиатур"""
@@ -687,7 +964,7 @@ class InteractiveKeyboardManager:
         return ReplyKeyboardMarkup(rows, resize_keyboard=True)
     
     @staticmethod
-    def create_units_menu(units: List[str], back_text: str = "🔙 Назад") -> ReplyKeyboardMarkup:
+    def create_units_menu(units: Sequence[str], back_text: str = "🔙 Назад") -> ReplyKeyboardMarkup:
         """Меню единиц измерения"""
         rows = [units[i:i+2] for i in range(0, len(units), 2)]
         rows.append([back_text])
@@ -697,10 +974,9 @@ class InteractiveKeyboardManager:
     def create_quick_actions_menu() -> ReplyKeyboardMarkup:
         """Меню быстрых действий"""
         keyboard = [
-            ["📏 Дюймы → см", "⚖️ Фунты → кг", "🌡️ °F → °C"],
-            ["💻 Мбит → МБ/с", "🛣️ Мили → км", "📐 Футы → метры"],
-            ["🔙 Главное меню"]
+            list(QUICK_CONVERSION_LABELS[i:i + 3]) for i in range(0, len(QUICK_CONVERSION_LABELS), 3)
         ]
+        keyboard.append(["🔙 Главное меню"])
         return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
     
     @staticmethod
@@ -732,38 +1008,62 @@ class InteractiveKeyboardManager:
             ["🔙 Главное меню"]
         ]
         return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-
-class AdvancedBotHandlers:
-    """Усовершенствованные обработчики бота"""
-    
-    def __init__(self):
-        self.converter = EnhancedUnitConverter()
-        self.db = AdvancedDatabaseManager()
-        self.keyboard = InteractiveKeyboardManager()
-        self.user_sessions = {}  # Кэш сессий пользователей
-    
-    def get_user_session(self, user_id: int) -> Dict:
-        """Получение или создание сессии пользователя"""
-        if user_id not in self.user_sessions:
-            self.user_sessions[user_id] = {
-                'last_activity': datetime.now(),
-                'conversion_count': 0,
-                'current_category': None,
-                'current_units': None
-            }
-        return self.user_sessions[user_id]
-    
-    def update_user_activity(self, user_id: int):
-        """Обновление активности пользователя"""
-        session = self.get_user_session(user_id)
-        session['last_activity'] = datetime.now()
     
-    async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Улучшенный обработчик команды /start"""
-        user = update.effective_user
-        self.update_user_activity(user.id)
-        
-        welcome_text = f"""🎉 Добро пожаловать, {user.first_name}!
+    @staticmethod
+    @functools.lru_cache(maxsize=BotConfig.DB_CACHE_SIZE)
+    def create_favorites_shortcuts_menu(names: Tuple[str, ...]) -> ReplyKeyboardMarkup:
+        """Меню быстрого доступа к избранному, общее для одинаковых наборов названий"""
+        keyboard = [[f"⭐ {name}"] for name in names]
+        keyboard.append(["🔙 Главное меню"])
+        return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+# Названия единиц по категориям и списки целевых единиц без исходной — общие кортежи,
+# которые не пересоздаются при каждом выборе категории или единицы
+UNIT_NAMES: Dict[str, Tuple[str, ...]] = {
+    category: tuple(units) for category, units in EnhancedUnitConverter.PHYSICAL_QUANTITIES.items()
+}
+UNITS_EXCLUDING: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    category: {
+        unit_from: tuple(unit for unit in EnhancedUnitConverter.get_compatible_units(category) if unit != unit_from)
+        for unit_from in units
+    }
+    for category, units in UNIT_NAMES.items()
+}
+
+# Допустимые целевые единицы: все совместимые единицы категории, кроме исходной
+TARGET_UNITS: Dict[str, Dict[str, FrozenSet[str]]] = {
+    category: {
+        unit_from: frozenset(targets)
+        for unit_from, targets in units.items()
+    }
+    for category, units in UNITS_EXCLUDING.items()
+}
+
+# Клавиатуры выбора категории и единиц не меняются во время работы,
+# поэтому строятся один раз при загрузке и переиспользуются всеми обработчиками
+MAIN_MENU_KEYBOARD = InteractiveKeyboardManager.create_main_menu()
+QUICK_ACTIONS_KEYBOARD = InteractiveKeyboardManager.create_quick_actions_menu()
+HISTORY_KEYBOARD = InteractiveKeyboardManager.create_history_menu()
+AFTER_CONVERSION_KEYBOARD = InteractiveKeyboardManager.create_after_conversion_menu()
+FAVORITES_KEYBOARD = InteractiveKeyboardManager.create_favorites_menu()
+BACK_KEYBOARD = ReplyKeyboardMarkup([["🔙 Назад"]], resize_keyboard=True)
+CATEGORIES_KEYBOARD = InteractiveKeyboardManager.create_categories_menu()
+UNITS_KEYBOARDS: Dict[str, ReplyKeyboardMarkup] = {
+    category: InteractiveKeyboardManager.create_units_menu(units)
+    for category, units in UNIT_NAMES.items()
+}
+TARGET_UNITS_KEYBOARDS: Dict[str, Dict[str, ReplyKeyboardMarkup]] = {
+    category: {
+        unit_from: InteractiveKeyboardManager.create_units_menu(targets)
+        for unit_from, targets in units.items()
+    }
+    for category, units in UNITS_EXCLUDING.items()
+}
+
+# Статические тексты ответов
+# Приветствие: меняется только имя пользователя между готовыми частями
+WELCOME_TEXT_PREFIX = "🎉 Добро пожаловать, "
+WELCOME_TEXT_SUFFIX = """!
 
 🤖 *Умный конвертер физических величин* версии 2.0
 
@@ -784,16 +1084,8 @@ class AdvancedBotHandlers:
 `10`, `15.5`, `1/2`, `sin(30)`, `2^8`, `pi/2`
 
 Начните с кнопки ниже! 👇"""
-        
-        await update.message.reply_text(
-            welcome_text,
-            reply_markup=self.keyboard.create_main_menu(),
-            parse_mode=ParseMode.MARKDOWN
-        )
-    
-    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Расширенная справка"""
-        help_text = """📚 *Полное руководство пользователя*
+
+HELP_TEXT = """📚 *Полное руководство пользователя*
 
 *Основные команды:*
 /start - Главное меню
@@ -832,140 +1124,384 @@ class AdvancedBotHandlers:
 • Используйте избранное для частых конвертаций
 • Просматривайте историю для повтора операций
 • Сохраняйте сложные конвертации в избранное"""
+
+CATEGORIES_TEXT = "📚 *Выберите категорию измерения:*\n\n" + "".join(
+    f"• *{category}* - {len(units)} единиц\n"
+    for category, units in EnhancedUnitConverter.PHYSICAL_QUANTITIES.items()
+)
+
+QUICK_CONVERSIONS_TEXT = """🚀 *Быстрые конвертации*
+
+Выберите один из популярных вариантов для мгновенной конвертации:"""
+
+HISTORY_MENU_TEXT = (
+    "📊 *История и статистика*\n\n"
+    "Выберите раздел для просмотра:"
+)
+
+NO_HISTORY_TEXT = (
+    "📈 У вас пока нет истории конвертаций.\n\n"
+    "Выполните первую конвертацию, и она появится здесь!"
+)
+
+NO_STATS_TEXT = (
+    "📊 У вас пока нет статистики.\n\n"
+    "Выполните первую конвертацию!"
+)
+
+FAVORITES_MENU_TEXT = (
+    "⭐ *Управление избранным*\n\n"
+    "Выберите действие:"
+)
+
+NO_FAVORITES_TEXT = (
+    "⭐ У вас пока нет избранных конвертаций.\n\n"
+    "Чтобы добавить конвертацию в избранное:\n"
+    "1. Выполните обычную конвертацию\n"
+    "2. Нажмите кнопку \"⭐ Сохранить в избранное\""
+)
+
+ERROR_TEXT = (
+    "❌ *Произошла непредвиденная ошибка*\n\n"
+    "Пожалуйста, попробуйте снова или используйте команду /start для перезагрузки бота."
+)
+
+# Готовые параметры ответа об ошибке: одинаковы для всех сообщений
+ERROR_REPLY_KWARGS = MappingProxyType({
+    "text": ERROR_TEXT,
+    "parse_mode": ParseMode.MARKDOWN,
+    "reply_markup": MAIN_MENU_KEYBOARD
+})
+
+# Размер базы единиц не меняется во время работы
+TOTAL_CATEGORIES = len(EnhancedUnitConverter.PHYSICAL_QUANTITIES)
+TOTAL_UNITS = sum(len(units) for units in EnhancedUnitConverter.PHYSICAL_QUANTITIES.values())
+
+# Эмодзи категорий в ответе с результатом конвертации
+CATEGORY_EMOJIS = MappingProxyType({
+    "Длина": "📏", "Масса": "⚖️", "Время": "⏰", "Температура": "🌡️",
+    "Площадь": "📐", "Объем": "🧪", "Скорость": "🚀", "Давление": "📊",
+    "Энергия": "⚡", "Мощность": "💪", "Информация": "💻",
+    "Древнерусские меры длины": "🏰"
+})
+
+# Подсказки к парам единиц (исходная, целевая)
+CONVERSION_HINTS: Dict[Tuple[str, str], str] = {
+    ("парсек (pc)", "локоть"): "💡 1 парсек ≈ 6.75e16 локтей",
+    ("верста", "километр (км)"): "💡 1 верста ≈ 1.0668 км",
+    ("сажень", "метр (м)"): "💡 1 сажень ≈ 2.1336 м",
+    ("аршин", "метр (м)"): "💡 1 аршин ≈ 0.7112 м",
+    ("локоть", "метр (м)"): "💡 1 локоть ≈ 0.4572 м",
+    ("пядь", "сантиметр (см)"): "💡 1 пядь ≈ 17.78 см",
+    ("вершок", "сантиметр (см)"): "💡 1 вершок ≈ 4.445 см",
+    ("дюйм (in)", "сантиметр (см)"): "💡 1 дюйм = 2.54 см",
+    ("фут (ft)", "метр (м)"): "💡 1 фут = 0.3048 м",
+    ("Фаренгейт (°F)", "Цельсий (°C)"): "💡 32°F = 0°C, 212°F = 100°C",
+    ("байт (byte)", "бит (bit)"): "💡 1 байт = 8 бит",
+    ("мегабит/сек (Mbps)", "мегабайт/сек (MBps)"): "💡 100 Мбит/с ≈ 12.5 МБ/с",
+}
+
+def _quick_conversion_result(value: float, from_unit: str, to_unit: str, category: str) -> Tuple[float, str]:
+    """Результат быстрой конвертации и готовый текст ответа"""
+    result = EnhancedUnitConverter.convert_standard(value, from_unit, to_unit, category)
+    result_str = EnhancedUnitConverter.format_result(result)
+    return result, (
+        f"🚀 *Результат быстрой конвертации:*\n\n"
+        f"```\n{value} {from_unit} = {result_str} {to_unit}\n```\n"
+        f"Для точной настройки используйте обычную конвертацию"
+    )
+
+# Входные значения быстрых конвертаций фиксированы, поэтому ответы считаются один раз
+QUICK_CONVERSION_RESULTS: Dict[str, Tuple[float, str]] = {
+    label: _quick_conversion_result(*conversion) for label, conversion in QUICK_CONVERSIONS.items()
+}
+
+# Отдельные потоки для БД по числу подключений пула: запросы к базе не занимают
+# общий пул потоков цикла событий и не ждут свободного подключения
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=BotConfig.DB_POOL_SIZE, thread_name_prefix="db")
+
+async def run_db(func, *args):
+    """Выполнение блокирующего вызова БД в отдельном потоке, не останавливая цикл событий"""
+    return await asyncio.get_running_loop().run_in_executor(DB_EXECUTOR, func, *args)
+
+class AdvancedBotHandlers:
+    """Усовершенствованные обработчики бота"""
+    
+    def __init__(self):
+        self.db = AdvancedDatabaseManager()
+        # Отложенная запись избранного и истории: фоновые задачи сохраняют накопленное пачками
+        self._favorites_queue: asyncio.Queue = asyncio.Queue()
+        self._favorites_writer: Optional[asyncio.Task] = None
+        # (пользователь, название) избранного, ждущего записи: кэш сбрасывается только после нее
+        self._pending_favorites: Set[Tuple[int, str]] = set()
+        self._history_queue: asyncio.Queue = asyncio.Queue()
+        self._history_writer: Optional[asyncio.Task] = None
+        # Кнопки навигации -> обработчики; связанные методы создаются один раз
+        self._text_dispatch = {
+            "🔄 Конвертировать": self.show_categories,
+            "⭐ Избранное": self.show_favorites_menu,
+            "🚀 Быстрые конвертации": self.show_quick_conversions,
+            "📊 История и статистика": self.show_history_and_stats,
+            "📈 Последние конвертации": self.show_recent_conversions,
+            "📊 Статистика": self.show_user_stats,
+            "📋 Список избранного": self.show_favorites_list,
+            "ℹ️ Справка": self.help_command
+        }
+        # Все кнопки маршрутизируются одним обработчиком текста, включая быстрые конвертации
+        self._text_dispatch.update(dict.fromkeys(QUICK_CONVERSION_LABELS, self.handle_quick_conversion))
+        # Команды вне диалога -> обработчики; регистрируются одним CommandHandler
+        self._command_dispatch = {
+            "start": self.start,
+            "help": self.help_command,
+            "favorites": self.show_favorites_menu,
+            "history": self.show_history_and_stats,
+            "stats": self.show_user_stats
+        }
+        # Кнопки меню после конвертации -> обработчики, возвращающие следующее состояние
+        self._after_conversion_dispatch = {
+            "🔙 Главное меню": self._after_conversion_main_menu,
+            "🔄 Новая конвертация": self.show_categories,
+            "📊 Еще значения": self._after_conversion_more_values,
+            "⭐ Сохранить в избранное": self._after_conversion_save_favorite,
+            "🚀 Быстрые конвертации": self._after_conversion_quick
+        }
+    
+    @property
+    def commands(self) -> List[str]:
+        """Имена команд, которые маршрутизирует handle_command"""
+        return list(self._command_dispatch)
+    
+    def queue_favorite(self, user_id: int, favorite_name: str, from_unit: str,
+                       to_unit: str, category: str) -> None:
+        """Постановка избранной конвертации в очередь на запись"""
+        if self._favorites_writer is None:
+            self._favorites_writer = asyncio.create_task(self._write_batches(
+                self._favorites_queue, self.db.save_favorites,
+                BotConfig.FAVORITES_FLUSH_DELAY, BotConfig.FAVORITES_BATCH_SIZE, "избранного",
+                self._favorites_saved))
+        self._pending_favorites.add((user_id, favorite_name))
+        self._favorites_queue.put_nowait((user_id, favorite_name, from_unit, to_unit, category))
+    
+    def _favorites_saved(self, batch: List[Tuple[int, str, str, str, str]]) -> None:
+        """Снятие записанного избранного из ожидающих"""
+        for user_id, favorite_name, *_ in batch:
+            self._pending_favorites.discard((user_id, favorite_name))
+    
+    def queue_conversion(self, user_id: int, conversion: ConversionResult) -> None:
+        """Постановка конвертации в очередь на запись в историю"""
+        if self._history_writer is None:
+            self._history_writer = asyncio.create_task(self._write_batches(
+                self._history_queue, self.db.save_conversions,
+                BotConfig.HISTORY_FLUSH_DELAY, BotConfig.HISTORY_BATCH_SIZE, "истории"))
+        self._history_queue.put_nowait((user_id, conversion))
+    
+    @staticmethod
+    async def _write_batches(work_queue: asyncio.Queue, save_batch, flush_delay: float,
+                             batch_size: int, what: str,
+                             on_saved: Optional[Callable[[list], None]] = None) -> None:
+        """Фоновая запись из очереди: одна транзакция на накопленную пачку"""
+        while True:
+            item = await work_queue.get()
+            if item is None:
+                return
+            batch = [item]
+            await asyncio.sleep(flush_delay)
+            
+            stop = False
+            while len(batch) < batch_size and not work_queue.empty():
+                item = work_queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            
+            try:
+                await run_db(save_batch, batch)
+            except Exception as e:
+                logger.error("Ошибка при сохранении %s: %s", what, e)
+            if on_saved is not None:
+                on_saved(batch)
+            if stop:
+                return
+    
+    async def post_shutdown(self, application: Application) -> None:
+        """Дописывает избранное и историю, оставшиеся в очереди, перед остановкой бота"""
+        if self._favorites_writer is not None:
+            self._favorites_queue.put_nowait(None)
+            await self._favorites_writer
+            self._favorites_writer = None
+        if self._history_writer is not None:
+            self._history_queue.put_nowait(None)
+            await self._history_writer
+            self._history_writer = None
+    
+    @staticmethod
+    def get_user_session(context: ContextTypes.DEFAULT_TYPE) -> UserSession:
+        """Получение или создание сессии пользователя в context.user_data"""
+        session = context.user_data.get("session")
+        if session is None:
+            session = context.user_data["session"] = UserSession(last_activity=time.time())
+        return session
+    
+    @staticmethod
+    def update_user_activity(context: ContextTypes.DEFAULT_TYPE):
+        """Обновление активности пользователя"""
+        AdvancedBotHandlers.get_user_session(context).last_activity = time.time()
+    
+    @staticmethod
+    async def sweep_sessions(context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Удаление данных пользователей, неактивных дольше SESSION_IDLE_TTL или сверх MAX_SESSIONS"""
+        application = context.application
+        deadline = time.time() - BotConfig.SESSION_IDLE_TTL
+        expired = []
+        active = []
+        for user_id, data in application.user_data.items():
+            session = data.get("session")
+            if session is None or session.last_activity < deadline:
+                expired.append(user_id)
+            else:
+                active.append((session.last_activity, user_id))
+        # Сверх лимита вытесняются дольше всех неактивные
+        if len(active) > BotConfig.MAX_SESSIONS:
+            active.sort()
+            expired.extend(user_id for _, user_id in active[:len(active) - BotConfig.MAX_SESSIONS])
+        # Запись пользователя удаляется целиком, в том числе из файла сессий
+        for user_id in expired:
+            application.drop_user_data(user_id)
+        if expired:
+            logger.info("🧹 Удалено неактивных сессий: %d", len(expired))
+    
+    async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Улучшенный обработчик команды /start"""
+        user = update.effective_user
+        self.update_user_activity(context)
         
         await update.message.reply_text(
-            help_text,
-            reply_markup=self.keyboard.create_main_menu(),
+            # Имя пользователя экранируется: символы разметки в нем ломают весь ответ
+            WELCOME_TEXT_PREFIX + escape_markdown(user.first_name) + WELCOME_TEXT_SUFFIX,
+            reply_markup=MAIN_MENU_KEYBOARD,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Расширенная справка"""
+
+        await update.message.reply_text(
+            HELP_TEXT,
+            reply_markup=MAIN_MENU_KEYBOARD,
             parse_mode=ParseMode.MARKDOWN
         )
     
     async def show_categories(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Показать категории для конвертации"""
-        self.update_user_activity(update.effective_user.id)
-        
-        categories_text = "📚 *Выберите категорию измерения:*\n\n"
-        for category, units in self.converter.PHYSICAL_QUANTITIES.items():
-            units_count = len(units)
-            categories_text += f"• *{category}* - {units_count} единиц\n"
+        self.update_user_activity(context)
         
         await update.message.reply_text(
-            categories_text,
-            reply_markup=self.keyboard.create_categories_menu(),
+            CATEGORIES_TEXT,
+            reply_markup=CATEGORIES_KEYBOARD,
             parse_mode=ParseMode.MARKDOWN
         )
         return BotState.SELECT_CATEGORY.value
     
     async def handle_category_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Обработка выбора категории"""
-        user_id = update.effective_user.id
-        category = update.message.text
-        self.update_user_activity(user_id)
+        category = sys.intern(update.message.text)
+        self.update_user_activity(context)
         
         if category == "🔙 Главное меню":
             await update.message.reply_text(
                 "Главное меню:",
-                reply_markup=self.keyboard.create_main_menu()
+                reply_markup=MAIN_MENU_KEYBOARD
             )
             return ConversationHandler.END
         
-        if category not in self.converter.PHYSICAL_QUANTITIES:
+        if category not in EnhancedUnitConverter.PHYSICAL_QUANTITIES:
             await update.message.reply_text(
                 "❌ Пожалуйста, выберите категорию из предложенных вариантов.",
-                reply_markup=self.keyboard.create_categories_menu()
+                reply_markup=CATEGORIES_KEYBOARD
             )
             return BotState.SELECT_CATEGORY.value
         
         # Сохраняем выбранную категорию в сессии
-        session = self.get_user_session(user_id)
-        session['current_category'] = category
-        
-        # Получаем единицы измерения ТОЛЬКО из выбранной категории
-        units = list(self.converter.PHYSICAL_QUANTITIES[category].keys())
+        session = self.get_user_session(context)
+        session.category = category
         
+        # Клавиатура с единицами ТОЛЬКО из выбранной категории
         await update.message.reply_text(
             f"📏 *{category}*\n\nВыберите исходную единицу измерения:",
-            reply_markup=self.keyboard.create_units_menu(units),
+            reply_markup=UNITS_KEYBOARDS[category],
             parse_mode=ParseMode.MARKDOWN
         )
         return BotState.SELECT_UNIT_FROM.value
     
     async def handle_unit_from_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Обработка выбора исходной единицы"""
-        user_id = update.effective_user.id
-        unit_from = update.message.text
-        self.update_user_activity(user_id)
+        unit_from = sys.intern(update.message.text)
+        self.update_user_activity(context)
         
         if unit_from == "🔙 Назад":
             await update.message.reply_text(
                 "📚 Выберите категорию:",
-                reply_markup=self.keyboard.create_categories_menu()
+                reply_markup=CATEGORIES_KEYBOARD
             )
             return BotState.SELECT_CATEGORY.value
         
-        session = self.get_user_session(user_id)
-        category = session.get('current_category')
+        session = self.get_user_session(context)
+        category = session.category
         
         # Проверяем, что единица принадлежит выбранной категории
-        if not category or unit_from not in self.converter.PHYSICAL_QUANTITIES.get(category, {}):
+        if not category or unit_from not in EnhancedUnitConverter.PHYSICAL_QUANTITIES.get(category, {}):
             await update.message.reply_text(
                 "❌ Пожалуйста, выберите единицу измерения из предложенных вариантов.",
-                reply_markup=self.keyboard.create_categories_menu()
+                reply_markup=CATEGORIES_KEYBOARD
             )
             return BotState.SELECT_CATEGORY.value
         
-        session['unit_from'] = unit_from
-        
-        # Получаем ВСЕ совместимые единицы для выбранной категории
-        compatible_units = self.converter.get_compatible_units(category)
-        available_units = [unit for unit in compatible_units.keys() if unit != unit_from]
+        session.unit_from = unit_from
         
+        # Клавиатура со ВСЕМИ совместимыми единицами, кроме исходной
         await update.message.reply_text(
             f"🎯 *Целевая единица*\n\nИз: {unit_from}\n\nВыберите целевую единицу:",
-            reply_markup=self.keyboard.create_units_menu(available_units),
+            reply_markup=TARGET_UNITS_KEYBOARDS[category][unit_from],
             parse_mode=ParseMode.MARKDOWN
         )
         return BotState.SELECT_UNIT_TO.value
     
     async def handle_unit_to_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Обработка выбора целевой единицы"""
-        user_id = update.effective_user.id
-        unit_to = update.message.text
-        self.update_user_activity(user_id)
+        unit_to = sys.intern(update.message.text)
+        self.update_user_activity(context)
         
         if unit_to == "🔙 Назад":
-            session = self.get_user_session(user_id)
-            category = session.get('current_category')
+            session = self.get_user_session(context)
+            category = session.category
             if category:
-                units = list(self.converter.PHYSICAL_QUANTITIES[category].keys())
                 await update.message.reply_text(
                     f"📏 Выберите исходную единицу для {category}:",
-                    reply_markup=self.keyboard.create_units_menu(units)
+                    reply_markup=UNITS_KEYBOARDS[category]
                 )
                 return BotState.SELECT_UNIT_FROM.value
         
-        session = self.get_user_session(user_id)
-        category = session.get('current_category')
-        unit_from = session.get('unit_from')
+        session = self.get_user_session(context)
+        category = session.category
+        unit_from = session.unit_from
         
         if not all([category, unit_from]):
             await update.message.reply_text(
                 "❌ Сессия устарела. Начните заново.",
-                reply_markup=self.keyboard.create_main_menu()
+                reply_markup=MAIN_MENU_KEYBOARD
             )
             return ConversationHandler.END
         
-        # Проверяем совместимость единиц через совместимые категории
-        compatible_units = self.converter.get_compatible_units(category)
-        if unit_to not in compatible_units:
+        # Целевая единица должна быть одной из предложенных кнопок
+        if unit_to not in TARGET_UNITS[category][unit_from]:
             await update.message.reply_text(
                 "❌ Выбранные единицы несовместимы. Пожалуйста, выберите другую единицу.",
-                reply_markup=self.keyboard.create_units_menu(
-                    [unit for unit in compatible_units.keys() if unit != unit_from]
-                )
+                reply_markup=TARGET_UNITS_KEYBOARDS[category][unit_from]
             )
             return BotState.SELECT_UNIT_TO.value
         
-        session['unit_to'] = unit_to
+        session.unit_to = unit_to
         
         # Создаем подсказку для пользователя
         hint = self._get_conversion_hint(unit_from, unit_to)
@@ -984,29 +1520,30 @@ class AdvancedBotHandlers:
         
         await update.message.reply_text(
             input_text,
-            reply_markup=ReplyKeyboardMarkup([["🔙 Назад"]], resize_keyboard=True),
+            reply_markup=BACK_KEYBOARD,
             parse_mode=ParseMode.MARKDOWN
         )
         return BotState.ENTER_VALUE.value
     
     async def handle_value_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Обработка ввода значения и выполнение конвертации"""
+        # Сообщение и его методы связываются один раз на все ветки обработчика
+        message = update.message
+        reply = message.reply_text
         user_id = update.effective_user.id
-        value_text = update.message.text
-        self.update_user_activity(user_id)
+        value_text = message.text
+        self.update_user_activity(context)
         
         if value_text == "🔙 Назад":
-            session = self.get_user_session(user_id)
-            category = session.get('current_category')
-            unit_from = session.get('unit_from')
+            session = self.get_user_session(context)
+            category = session.category
+            unit_from = session.unit_from
             
-            if category and unit_from:
-                compatible_units = self.converter.get_compatible_units(category)
-                available_units = [unit for unit in compatible_units.keys() if unit != unit_from]
-                
-                await update.message.reply_text(
+            target_keyboard = TARGET_UNITS_KEYBOARDS.get(category, {}).get(unit_from)
+            if target_keyboard:
+                await reply(
                     "🎯 Выберите целевую единицу:",
-                    reply_markup=self.keyboard.create_units_menu(available_units)
+                    reply_markup=target_keyboard
                 )
                 return BotState.SELECT_UNIT_TO.value
         
@@ -1014,36 +1551,36 @@ class AdvancedBotHandlers:
         is_valid, value, error_message = EnhancedUnitConverter.validate_input(value_text)
         
         if not is_valid:
-            await update.message.reply_text(error_message)
+            await reply(error_message)
             return BotState.ENTER_VALUE.value
         
-        session = self.get_user_session(user_id)
-        category = session.get('current_category')
-        unit_from = session.get('unit_from')
-        unit_to = session.get('unit_to')
+        session = self.get_user_session(context)
+        category = session.category
+        unit_from = session.unit_from
+        unit_to = session.unit_to
         
         if not all([category, unit_from, unit_to]):
-            await update.message.reply_text(
+            await reply(
                 "❌ Ошибка сессии. Пожалуйста, начните заново.",
-                reply_markup=self.keyboard.create_main_menu()
+                reply_markup=MAIN_MENU_KEYBOARD
             )
             return ConversationHandler.END
         
         try:
             # Выполняем конвертацию с использованием совместимых единиц
-            result = self.converter.convert_standard(value, unit_from, unit_to, category)
+            result = EnhancedUnitConverter.convert_standard(value, unit_from, unit_to, category)
             
             # Проверка на специальные значения
-            if math.isinf(result) or math.isnan(result):
-                await update.message.reply_text(
+            if not math.isfinite(result):
+                await reply(
                     "❌ Результат конвертации выходит за допустимые пределы",
-                    reply_markup=self.keyboard.create_main_menu()
+                    reply_markup=MAIN_MENU_KEYBOARD
                 )
                 return ConversationHandler.END
             
             # Форматируем результат
-            result_str = self.converter.format_result(result)
-            value_str = self.converter.format_result(value)
+            result_str = EnhancedUnitConverter.format_result(result)
+            value_str = EnhancedUnitConverter.format_result(value)
             
             # Создаем объект результата
             conversion_result = ConversionResult(
@@ -1055,219 +1592,206 @@ class AdvancedBotHandlers:
                 timestamp=datetime.now()
             )
             
-            # Сохраняем в базу данных
-            self.db.save_conversion(user_id, conversion_result)
+            # Ставим в очередь на запись в историю
+            self.queue_conversion(user_id, conversion_result)
             
             # Обновляем сессию
-            session['conversion_count'] += 1
-            session['last_conversion'] = conversion_result
+            session.conversion_count += 1
+            session.last_conversion = conversion_result
             
             # Формируем красивый ответ
             response = self._format_conversion_response(conversion_result, value_str, result_str)
             
-            await update.message.reply_text(
+            await reply(
                 response,
-                reply_markup=self.keyboard.create_after_conversion_menu(),
+                reply_markup=AFTER_CONVERSION_KEYBOARD,
                 parse_mode=ParseMode.MARKDOWN
             )
             
             return BotState.SAVE_FAVORITE.value
             
         except Exception as e:
-            logger.error(f"Ошибка конвертации: {e}")
-            await update.message.reply_text(
+            logger.error("Ошибка конвертации: %s", e)
+            await reply(
                 f"❌ Ошибка при конвертации: {str(e)}\nПожалуйста, попробуйте снова.",
-                reply_markup=self.keyboard.create_main_menu()
+                reply_markup=MAIN_MENU_KEYBOARD
             )
             return ConversationHandler.END
     
     async def handle_after_conversion(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Обработка действий после конвертации"""
         user_input = update.message.text
-        user_id = update.effective_user.id
-        self.update_user_activity(user_id)
+        self.update_user_activity(context)
+        
+        handler = self._after_conversion_dispatch.get(user_input)
+        if handler is not None:
+            return await handler(update, context)
         
-        if user_input == "🔙 Главное меню":
+        await update.message.reply_text(
+            "Пожалуйста, используйте кнопки для выбора действия",
+            reply_markup=MAIN_MENU_KEYBOARD
+        )
+        return ConversationHandler.END
+    
+    async def _after_conversion_main_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Возврат в главное меню после конвертации"""
+        await update.message.reply_text(
+            "Главное меню:",
+            reply_markup=MAIN_MENU_KEYBOARD
+        )
+        return ConversationHandler.END
+    
+    async def _after_conversion_more_values(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
+        """Ввод следующего значения для тех же единиц"""
+        session = self.get_user_session(context)
+        if session.unit_from and session.unit_to:
             await update.message.reply_text(
-                "Главное меню:",
-                reply_markup=self.keyboard.create_main_menu()
+                "🔢 Введите следующее значение для конвертации:",
+                reply_markup=BACK_KEYBOARD
             )
-            return ConversationHandler.END
-        
-        elif user_input == "🔄 Новая конвертация":
-            return await self.show_categories(update, context)
-        
-        elif user_input == "📊 Еще значения":
-            session = self.get_user_session(user_id)
-            if 'unit_from' in session and 'unit_to' in session:
-                await update.message.reply_text(
-                    "🔢 Введите следующее значение для конвертации:",
-                    reply_markup=ReplyKeyboardMarkup([["🔙 Назад"]], resize_keyboard=True)
-                )
-                return BotState.ENTER_VALUE.value
-        
-        elif user_input == "⭐ Сохранить в избранное":
-            session = self.get_user_session(user_id)
-            if 'last_conversion' in session:
-                conversion = session['last_conversion']
-                favorite_name = f"{conversion.unit_from} → {conversion.unit_to}"
-                
-                if not self.db.is_favorite_name_unique(user_id, favorite_name):
-                    await update.message.reply_text(
-                        f"❌ Конвертация \"{favorite_name}\" уже есть в избранном",
-                        reply_markup=self.keyboard.create_main_menu()
-                    )
-                    return ConversationHandler.END
-                
-                self.db.save_favorite(
-                    user_id, favorite_name, 
-                    conversion.unit_from, conversion.unit_to, conversion.category
-                )
-                
-                await update.message.reply_text(
-                    f"✅ Конвертация сохранена в избранное как:\n\"{favorite_name}\"",
-                    reply_markup=self.keyboard.create_main_menu()
-                )
-            else:
+            return BotState.ENTER_VALUE.value
+        return None
+    
+    async def _after_conversion_save_favorite(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Сохранение последней конвертации в избранное"""
+        user_id = update.effective_user.id
+        session = self.get_user_session(context)
+        if session.last_conversion is not None:
+            conversion = session.last_conversion
+            favorite_name = f"{conversion.unit_from} → {conversion.unit_to}"
+            
+            # Проверка по ожидающим записи и по кэшированному индексу избранного; ожидающие
+            # проверяются и после чтения, так как повторное нажатие могло прийти за это время
+            favorite_key = (user_id, favorite_name)
+            if (favorite_key in self._pending_favorites
+                    or await run_db(self.db.get_user_favorite, user_id, favorite_name) is not None
+                    or favorite_key in self._pending_favorites):
                 await update.message.reply_text(
-                    "❌ Нет данных для сохранения",
-                    reply_markup=self.keyboard.create_main_menu()
+                    f"❌ Конвертация \"{favorite_name}\" уже есть в избранном",
+                    reply_markup=MAIN_MENU_KEYBOARD
                 )
-            return ConversationHandler.END
-        
-        elif user_input == "🚀 Быстрые конвертации":
-            await self.show_quick_conversions(update, context)
-            return ConversationHandler.END
-        
+                return ConversationHandler.END
+            
+            self.queue_favorite(
+                user_id, favorite_name, 
+                conversion.unit_from, conversion.unit_to, conversion.category
+            )
+            
+            await update.message.reply_text(
+                f"✅ Конвертация сохранена в избранное как:\n\"{favorite_name}\"",
+                reply_markup=MAIN_MENU_KEYBOARD
+            )
         else:
             await update.message.reply_text(
-                "Пожалуйста, используйте кнопки для выбора действия",
-                reply_markup=self.keyboard.create_main_menu()
+                "❌ Нет данных для сохранения",
+                reply_markup=MAIN_MENU_KEYBOARD
             )
-            return ConversationHandler.END
+        return ConversationHandler.END
+    
+    async def _after_conversion_quick(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """Переход к быстрым конвертациям"""
+        await self.show_quick_conversions(update, context)
+        return ConversationHandler.END
     
     async def show_quick_conversions(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Показать быстрые конвертации"""
-        quick_text = """🚀 *Быстрые конвертации*
-
-Выберите один из популярных вариантов для мгновенной конвертации:"""
-        
         await update.message.reply_text(
-            quick_text,
-            reply_markup=self.keyboard.create_quick_actions_menu(),
+            QUICK_CONVERSIONS_TEXT,
+            reply_markup=QUICK_ACTIONS_KEYBOARD,
             parse_mode=ParseMode.MARKDOWN
         )
     
     async def handle_quick_conversion(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработка быстрой конвертации"""
-        conversion_type = update.message.text
-        self.update_user_activity(update.effective_user.id)
+        message = update.message
+        reply = message.reply_text
+        conversion_type = message.text
+        self.update_user_activity(context)
         
         if conversion_type == "🔙 Главное меню":
-            await update.message.reply_text(
+            await reply(
                 "Главное меню:",
-                reply_markup=self.keyboard.create_main_menu()
+                reply_markup=MAIN_MENU_KEYBOARD
             )
             return
         
-        # Предопределенные быстрые конвертации
-        quick_conversions = {
-            "📏 Дюймы → см": (10, "дюйм (in)", "сантиметр (см)", "Длина"),
-            "⚖️ Фунты → кг": (1, "фунт (lb)", "килограмм (кг)", "Масса"),
-            "🌡️ °F → °C": (32, "Фаренгейт (°F)", "Цельсий (°C)", "Температура"),
-            "💻 Мбит → МБ/с": (100, "мегабит/сек (Mbps)", "мегабайт/сек (MBps)", "Скорость передачи данных"),
-            "🛣️ Мили → км": (1, "миля (mi)", "километр (км)", "Длина"),
-            "📐 Футы → метры": (6, "фут (ft)", "метр (м)", "Длина")
-        }
-        
-        if conversion_type in quick_conversions:
-            value, from_unit, to_unit, category = quick_conversions[conversion_type]
+        if conversion_type in QUICK_CONVERSIONS:
+            value, from_unit, to_unit, category = QUICK_CONVERSIONS[conversion_type]
+            result, response = QUICK_CONVERSION_RESULTS[conversion_type]
             
             try:
-                if category == "Температура":
-                    result = self.converter.convert_temperature(value, from_unit, to_unit)
-                else:
-                    result = self.converter.convert_standard(value, from_unit, to_unit, category)
-                
-                result_str = self.converter.format_result(result)
-                
                 # Сохраняем в историю
                 conversion_result = ConversionResult(
                     value=value, unit_from=from_unit, unit_to=to_unit,
                     result=result, category=category, timestamp=datetime.now()
                 )
-                self.db.save_conversion(update.effective_user.id, conversion_result)
+                self.queue_conversion(update.effective_user.id, conversion_result)
                 
-                await update.message.reply_text(
-                    f"🚀 *Результат быстрой конвертации:*\n\n"
-                    f"```\n{value} {from_unit} = {result_str} {to_unit}\n```\n"
-                    f"Для точной настройки используйте обычную конвертацию",
-                    reply_markup=self.keyboard.create_main_menu(),
+                await reply(
+                    response,
+                    reply_markup=MAIN_MENU_KEYBOARD,
                     parse_mode=ParseMode.MARKDOWN
                 )
                 
             except Exception as e:
-                await update.message.reply_text(
+                await reply(
                     f"❌ Ошибка при конвертации: {str(e)}",
-                    reply_markup=self.keyboard.create_main_menu()
+                    reply_markup=MAIN_MENU_KEYBOARD
                 )
     
     async def show_history_and_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Показать меню истории и статистики"""
         await update.message.reply_text(
-            "📊 *История и статистика*\n\n"
-            "Выберите раздел для просмотра:",
-            reply_markup=self.keyboard.create_history_menu(),
+            HISTORY_MENU_TEXT,
+            reply_markup=HISTORY_KEYBOARD,
             parse_mode=ParseMode.MARKDOWN
         )
     
     async def show_recent_conversions(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Показать последние конвертации"""
         user_id = update.effective_user.id
-        self.update_user_activity(user_id)
+        self.update_user_activity(context)
         
-        conversions = self.db.get_recent_conversions(user_id, 5)
+        conversions = await run_db(self.db.get_recent_conversions, user_id, 5)
         
         if not conversions:
             await update.message.reply_text(
-                "📈 У вас пока нет истории конвертаций.\n\n"
-                "Выполните первую конвертацию, и она появится здесь!",
-                reply_markup=self.keyboard.create_history_menu()
+                NO_HISTORY_TEXT,
+                reply_markup=HISTORY_KEYBOARD
             )
             return
         
-        history_text = "📈 *Последние конвертации:*\n\n"
-        for i, conv in enumerate(conversions, 1):
-            from_val = self.converter.format_result(conv['from_value'])
-            to_val = self.converter.format_result(conv['to_value'])
-            history_text += f"*{i}.* `{from_val} {conv['from_unit']} → {to_val} {conv['to_unit']}`\n\n"
+        format_result = EnhancedUnitConverter.format_result
+        history_text = "📈 *Последние конвертации:*\n\n" + "".join(
+            f"*{i}.* `{format_result(conv['from_value'])} {conv['from_unit']} → "
+            f"{format_result(conv['to_value'])} {conv['to_unit']}`\n\n"
+            for i, conv in enumerate(conversions, 1)
+        )
         
         await update.message.reply_text(
             history_text,
-            reply_markup=self.keyboard.create_history_menu(),
+            reply_markup=HISTORY_KEYBOARD,
             parse_mode=ParseMode.MARKDOWN
         )
     
     async def show_user_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Показать подробную статистику пользователя"""
         user_id = update.effective_user.id
-        self.update_user_activity(user_id)
+        self.update_user_activity(context)
         
-        stats = self.db.get_user_stats(user_id)
+        # Статистика и частые конвертации читаются за одно обращение к потоку БД
+        stats, most_used = await run_db(self.db.get_user_stats_bundle, user_id, 3)
         
         if not stats:
             await update.message.reply_text(
-                "📊 У вас пока нет статистики.\n\n"
-                "Выполните первую конвертацию!",
-                reply_markup=self.keyboard.create_history_menu()
+                NO_STATS_TEXT,
+                reply_markup=HISTORY_KEYBOARD
             )
             return
         
-        # Получаем дополнительные данные
-        most_used = self.db.get_most_used_conversions(user_id, 3)
-        
-        first_seen = datetime.strptime(stats['first_seen'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y')
-        days_active = (datetime.now() - datetime.strptime(stats['first_seen'], '%Y-%m-%d %H:%M:%S')).days
+        first_seen_at = datetime.fromtimestamp(stats['first_seen'])
+        first_seen = first_seen_at.strftime('%d.%m.%Y')
+        days_active = (datetime.now() - first_seen_at).days
         
         stats_text = (
             f"📊 *Ваша статистика*\n\n"
@@ -1278,56 +1802,53 @@ class AdvancedBotHandlers:
         )
         
         if most_used:
-            stats_text += "*Частые конвертации:*\n"
-            for i, conv in enumerate(most_used, 1):
-                stats_text += f"{i}. `{conv['from_unit']} → {conv['to_unit']}` - {conv['usage_count']} раз\n"
+            stats_text += "*Частые конвертации:*\n" + "".join(
+                f"{i}. `{conv['from_unit']} → {conv['to_unit']}` - {conv['usage_count']} раз\n"
+                for i, conv in enumerate(most_used, 1)
+            )
         
         await update.message.reply_text(
             stats_text,
-            reply_markup=self.keyboard.create_history_menu(),
+            reply_markup=HISTORY_KEYBOARD,
             parse_mode=ParseMode.MARKDOWN
         )
     
     async def show_favorites_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Показать меню избранного"""
         await update.message.reply_text(
-            "⭐ *Управление избранным*\n\n"
-            "Выберите действие:",
-            reply_markup=self.keyboard.create_favorites_menu(),
+            FAVORITES_MENU_TEXT,
+            reply_markup=FAVORITES_KEYBOARD,
             parse_mode=ParseMode.MARKDOWN
         )
     
     async def show_favorites_list(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Показать список избранных конвертаций"""
         user_id = update.effective_user.id
-        self.update_user_activity(user_id)
+        self.update_user_activity(context)
         
-        favorites = self.db.get_user_favorites(user_id)
+        favorites = await run_db(self.db.get_user_favorites, user_id)
         
         if not favorites:
             await update.message.reply_text(
-                "⭐ У вас пока нет избранных конвертаций.\n\n"
-                "Чтобы добавить конвертацию в избранное:\n"
-                "1. Выполните обычную конвертацию\n"
-                "2. Нажмите кнопку \"⭐ Сохранить в избранное\"",
-                reply_markup=self.keyboard.create_favorites_menu()
+                NO_FAVORITES_TEXT,
+                reply_markup=FAVORITES_KEYBOARD
             )
             return
         
-        favorites_text = "⭐ *Ваши избранные конвертации:*\n\n"
-        for i, fav in enumerate(favorites, 1):
-            favorites_text += f"*{i}.* {fav['favorite_name']}\n"
-            favorites_text += f"   `{fav['from_unit']} → {fav['to_unit']}`\n\n"
+        favorites_text = "⭐ *Ваши избранные конвертации:*\n\n" + "".join(
+            f"*{i}.* {fav['favorite_name']}\n"
+            f"   `{fav['from_unit']} → {fav['to_unit']}`\n\n"
+            for i, fav in enumerate(favorites, 1)
+        )
         
-        # Создаем клавиатуру для быстрого доступа к избранному
-        keyboard = []
-        for favorite in favorites[:5]:  # Показываем первые 5
-            keyboard.append([f"⭐ {favorite['favorite_name']}"])
-        keyboard.append(["🔙 Главное меню"])
+        # Клавиатура для быстрого доступа к избранному: первые 5 записей
+        keyboard = InteractiveKeyboardManager.create_favorites_shortcuts_menu(
+            tuple(favorite['favorite_name'] for favorite in favorites[:5])
+        )
         
         await update.message.reply_text(
             favorites_text,
-            reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True),
+            reply_markup=keyboard,
             parse_mode=ParseMode.MARKDOWN
         )
     
@@ -1335,25 +1856,22 @@ class AdvancedBotHandlers:
         """Обработка выбора избранной конвертации"""
         user_id = update.effective_user.id
         favorite_name = update.message.text[2:]  # Убираем "⭐ "
-        self.update_user_activity(user_id)
+        self.update_user_activity(context)
         
-        favorites = self.db.get_user_favorites(user_id)
-        selected_favorite = next((f for f in favorites if f['favorite_name'] == favorite_name), None)
+        selected_favorite = await run_db(self.db.get_user_favorite, user_id, favorite_name)
         
         if selected_favorite:
             # Сохраняем выбранную конвертацию в сессии
-            session = self.get_user_session(user_id)
-            session.update({
-                'current_category': selected_favorite['category'],
-                'unit_from': selected_favorite['from_unit'],
-                'unit_to': selected_favorite['to_unit']
-            })
+            session = self.get_user_session(context)
+            session.category = selected_favorite['category']
+            session.unit_from = selected_favorite['from_unit']
+            session.unit_to = selected_favorite['to_unit']
             
             await update.message.reply_text(
                 f"⭐ *{favorite_name}*\n\n"
                 f"Введите значение для конвертации:\n"
                 f"`{selected_favorite['from_unit']} → {selected_favorite['to_unit']}`",
-                reply_markup=ReplyKeyboardMarkup([["🔙 Назад"]], resize_keyboard=True),
+                reply_markup=BACK_KEYBOARD,
                 parse_mode=ParseMode.MARKDOWN
             )
             
@@ -1362,106 +1880,70 @@ class AdvancedBotHandlers:
         else:
             await update.message.reply_text(
                 "❌ Избранная конвертация не найдена",
-                reply_markup=self.keyboard.create_favorites_menu()
+                reply_markup=FAVORITES_KEYBOARD
             )
     
     def _get_conversion_hint(self, from_unit: str, to_unit: str) -> str:
         """Получить подсказку для конвертации"""
-        hints = {
-            ("парсек (pc)", "локоть"): "💡 1 парсек ≈ 6.75e16 локтей",
-            ("верста", "километр (км)"): "💡 1 верста ≈ 1.0668 км",
-            ("сажень", "метр (м)"): "💡 1 сажень ≈ 2.1336 м",
-            ("аршин", "метр (м)"): "💡 1 аршин ≈ 0.7112 м",
-            ("локоть", "метр (м)"): "💡 1 локоть ≈ 0.4572 м",
-            ("пядь", "сантиметр (см)"): "💡 1 пядь ≈ 17.78 см",
-            ("вершок", "сантиметр (см)"): "💡 1 вершок ≈ 4.445 см",
-            ("дюйм (in)", "сантиметр (см)"): "💡 1 дюйм = 2.54 см",
-            ("фут (ft)", "метр (м)"): "💡 1 фут = 0.3048 м",
-            ("Фаренгейт (°F)", "Цельсий (°C)"): "💡 32°F = 0°C, 212°F = 100°C",
-            ("байт (byte)", "бит (bit)"): "💡 1 байт = 8 бит",
-            ("мегабит/сек (Mbps)", "мегабайт/сек (MBps)"): "💡 100 Мбит/с ≈ 12.5 МБ/с",
-        }
-        
-        for (from_u, to_u), hint in hints.items():
-            if from_u in from_unit and to_u in to_unit:
-                return hint
-        
-        return "💡 Введите значение для конвертации"
+        return CONVERSION_HINTS.get((from_unit, to_unit), "💡 Введите значение для конвертации")
     
     def _format_conversion_response(self, conversion: ConversionResult, value_str: str, result_str: str) -> str:
         """Форматирование ответа с результатом конвертации"""
+        category = conversion.category
         # Определяем эмодзи для категории
-        category_emojis = {
-            "Длина": "📏", "Масса": "⚖️", "Время": "⏰", "Температура": "🌡️",
-            "Площадь": "📐", "Объем": "🧪", "Скорость": "🚀", "Давление": "📊",
-            "Энергия": "⚡", "Мощность": "💪", "Информация": "💻",
-            "Древнерусские меры длины": "🏰"
-        }
-        
-        emoji = category_emojis.get(conversion.category, "🔢")
+        emoji = CATEGORY_EMOJIS.get(category, "🔢")
         
-        response = (
+        return (
             f"{emoji} *Результат конвертации*\n\n"
             f"*Исходное значение:* `{value_str} {conversion.unit_from}`\n"
             f"*Результат:* `{result_str} {conversion.unit_to}`\n"
-            f"*Категория:* {conversion.category}"
+            f"*Категория:* {category}"
         )
-        
-        return response
+    
+    async def handle_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Маршрутизация команд по имени"""
+        command = update.message.text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+        handler = self._command_dispatch.get(command)
+        if handler is not None:
+            await handler(update, context)
     
     async def handle_text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обработка текстовых сообщений для навигации"""
-        text = update.message.text
-        self.update_user_activity(update.effective_user.id)
+        message = update.message
+        text = message.text
+        self.update_user_activity(context)
         
-        navigation_handlers = {
-            "🔄 Конвертировать": self.show_categories,
-            "⭐ Избранное": self.show_favorites_menu,
-            "🚀 Быстрые конвертации": self.show_quick_conversions,
-            "📊 История и статистика": self.show_history_and_stats,
-            "📈 Последние конвертации": self.show_recent_conversions,
-            "📊 Статистика": self.show_user_stats,
-            "📋 Список избранного": self.show_favorites_list,
-            "ℹ️ Справка": self.help_command
-        }
-        
-        if text in navigation_handlers:
-            await navigation_handlers[text](update, context)
+        handler = self._text_dispatch.get(text)
+        if handler is not None:
+            await handler(update, context)
         elif text.startswith("⭐ "):
             await self.handle_favorite_selection(update, context)
         else:
-            await update.message.reply_text(
+            await message.reply_text(
                 "🤖 Используйте кнопки ниже для навигации или команду /help для справки",
-                reply_markup=self.keyboard.create_main_menu()
+                reply_markup=MAIN_MENU_KEYBOARD
             )
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Глобальный обработчик ошибок"""
-    logger.error(f"Ошибка: {context.error}", exc_info=context.error)
+    logger.error("Ошибка: %s", context.error, exc_info=context.error)
     
-    if update and update.effective_message:
-        error_text = (
-            "❌ *Произошла непредвиденная ошибка*\n\n"
-            "Пожалуйста, попробуйте снова или используйте команду /start для перезагрузки бота."
-        )
-        
+    message = update.effective_message if update else None
+    if message:
         try:
-            await update.effective_message.reply_text(
-                error_text,
-                parse_mode=ParseMode.MARKDOWN,
-                reply_markup=InteractiveKeyboardManager().create_main_menu()
-            )
+            await message.reply_text(**ERROR_REPLY_KWARGS)
         except Exception as e:
-            logger.error(f"Не удалось отправить сообщение об ошибке: {e}")
+            logger.error("Не удалось отправить сообщение об ошибке: %s", e)
 
 async def cleanup_task(context: ContextTypes.DEFAULT_TYPE):
     """Задача для очистки устаревших данных"""
     try:
-        db = AdvancedDatabaseManager()
-        db.cleanup_old_history(30)  # Очищаем историю старше 30 дней
+        # Общий менеджер БД с уже открытым пулом подключений; удаление идет в потоке БД
+        db: AdvancedDatabaseManager = context.application.bot_data["db"]
+        await run_db(db.cleanup_old_history, 30)  # Очищаем историю старше 30 дней
         logger.info("✅ Очистка устаревшей истории выполнена")
     except Exception as e:
-        logger.error(f"Ошибка при очистке истории: {e}")
+        logger.error("Ошибка при очистке истории: %s", e)
 
 async def post_init(application: Application) -> None:
     """Функция, выполняемая после инициализации бота"""
@@ -1473,24 +1955,12 @@ async def post_init(application: Application) -> None:
         job_queue.run_repeating(cleanup_task, interval=86400, first=10)  # Ежедневно
     
     # Статистика при запуске
-    total_categories = len(EnhancedUnitConverter.PHYSICAL_QUANTITIES)
-    total_units = sum(len(units) for units in EnhancedUnitConverter.PHYSICAL_QUANTITIES.values())
-    logger.info(f"📊 Загружено {total_categories} категорий с {total_units} единицами измерения")
+    logger.info("📊 Загружено %d категорий с %d единицами измерения", TOTAL_CATEGORIES, TOTAL_UNITS)
 
-def main() -> None:
-    """Запуск усовершенствованного бота"""
-    # Создаем приложение
-    application = Application.builder().token(TOKEN).post_init(post_init).build()
-    
-    # Инициализируем обработчики
-    handlers = AdvancedBotHandlers()
-    
-    # Добавляем обработчики команд
-    application.add_handler(CommandHandler("start", handlers.start))
-    application.add_handler(CommandHandler("help", handlers.help_command))
-    application.add_handler(CommandHandler("favorites", handlers.show_favorites_menu))
-    application.add_handler(CommandHandler("history", handlers.show_history_and_stats))
-    application.add_handler(CommandHandler("stats", handlers.show_user_stats))
+def register_handlers(application: Application, handlers: AdvancedBotHandlers) -> None:
+    """Регистрация обработчиков команд, диалога конвертации, текста и ошибок"""
+    # Добавляем обработчики команд: один обработчик на все команды вместо перебора по одному
+    application.add_handler(CommandHandler(handlers.commands, handlers.handle_command))
     
     # ConversationHandler для процесса конвертации
     conv_handler = ConversationHandler(
@@ -1516,42 +1986,17 @@ def main() -> None:
             ],
         },
         fallbacks=[CommandHandler("cancel", handlers.start)],
+        name="conversion",
+        persistent=True,
+        # Диалог завершается вместе с сессией: после SESSION_IDLE_TTL без сообщений
+        # выбранные единицы удаляются очисткой, и состояние диалога тоже сбрасывается
+        conversation_timeout=BotConfig.SESSION_IDLE_TTL,
     )
     
     application.add_handler(conv_handler)
     
-    # Обработчики быстрых конвертаций
-    application.add_handler(MessageHandler(
-        filters.Text(["🚀 Быстрые конвертации"]), 
-        handlers.show_quick_conversions
-    ))
-    
-    quick_conversion_types = [
-        "📏 Дюймы → см", "⚖️ Фунты → кг", "🌡️ °F → °C",
-        "💻 Мбит → МБ/с", "🛣️ Мили → км", "📐 Футы → метры"
-    ]
-    application.add_handler(MessageHandler(
-        filters.Text(quick_conversion_types), 
-        handlers.handle_quick_conversion
-    ))
-    
-    # Обработчики истории и статистики
-    application.add_handler(MessageHandler(
-        filters.Text(["📈 Последние конвертации"]), 
-        handlers.show_recent_conversions
-    ))
-    application.add_handler(MessageHandler(
-        filters.Text(["📊 Статистика"]), 
-        handlers.show_user_stats
-    ))
-    
-    # Обработчики избранного
-    application.add_handler(MessageHandler(
-        filters.Text(["📋 Список избранного"]), 
-        handlers.show_favorites_list
-    ))
-    
-    # Основной обработчик текстовых сообщений (навигация)
+    # Основной обработчик текстовых сообщений: кнопки меню, быстрые конвертации,
+    # история, статистика и избранное выбираются одним поиском в словаре
     application.add_handler(MessageHandler(
         filters.TEXT & ~filters.COMMAND, 
         handlers.handle_text_message
@@ -1559,10 +2004,53 @@ def main() -> None:
     
     # Обработчик ошибок
     application.add_error_handler(error_handler)
+
+def main() -> None:
+    """Запуск усовершенствованного бота"""
+    # Цикл событий на libuv снижает накладные расходы на каждое обращение к Telegram
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("⚡ Используется цикл событий uvloop")
+    
+    # Инициализируем обработчики
+    handlers = AdvancedBotHandlers()
+    
+    # Создаем приложение
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        # Запросы к Bot API (sendMessage и др.) мультиплексируются в одном соединении;
+        # getUpdates остается одним долгим запросом по HTTP/1.1
+        .http_version(BotConfig.HTTP_VERSION)
+        .post_init(post_init)
+        .post_shutdown(handlers.post_shutdown)
+        # Сессии пользователей и состояния диалогов сохраняются между перезапусками;
+        # изменения копятся в памяти и пишутся на диск раз в PERSISTENCE_INTERVAL
+        .persistence(PicklePersistence(
+            BotConfig.PERSISTENCE_PATH,
+            store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+            update_interval=BotConfig.PERSISTENCE_INTERVAL
+        ))
+        # Токен-бакет на исходящие запросы вместо упора в лимиты Telegram
+        .rate_limiter(AIORateLimiter(overall_max_rate=BotConfig.TELEGRAM_MAX_RATE,
+                                     max_retries=BotConfig.RATE_LIMIT_RETRIES))
+        .build()
+    )
+    # Один менеджер БД на все приложение: обработчики и фоновые задачи делят пул подключений
+    application.bot_data["db"] = handlers.db
+    
+    # Периодически освобождаем память от неактивных сессий
+    if application.job_queue:
+        application.job_queue.run_repeating(handlers.sweep_sessions, interval=BotConfig.SESSION_SWEEP_INTERVAL,
+                                            first=BotConfig.SESSION_SWEEP_INTERVAL)
+    
+    register_handlers(application, handlers)
     
     # Запуск бота
     logger.info("🚀 Запускаю продвинутого бота-конвертера...")
-    application.run_polling()
+    # Сообщения, накопившиеся за время простоя, не обрабатываются пачкой при старте;
+    # бот работает только с сообщениями, остальные типы обновлений Telegram не присылает
+    application.run_polling(allowed_updates=[Update.MESSAGE], drop_pending_updates=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# bot.py читает токен при импорте; для тестов достаточно фиктивного
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,359 @@
+import asyncio
+import time
+import types
+from datetime import datetime
+
+import pytest
+from telegram import Update
+from telegram.ext import Application, ExtBot, PicklePersistence
+
+import bot
+from bot import AdvancedBotHandlers, ConversionResult, EnhancedUnitConverter, LRUCache
+
+
+def test_nested_power_is_rejected_quickly():
+    """Вложенные степени не строят огромные целые на цикле событий"""
+    start = time.monotonic()
+    is_valid, value, _ = EnhancedUnitConverter.validate_input("((10^1000)^1000)^100")
+    assert not is_valid and value is None
+    assert time.monotonic() - start < 0.5
+
+
+def test_small_powers_still_evaluate():
+    assert EnhancedUnitConverter.validate_input("2^8") == (True, 256.0, None)
+    assert EnhancedUnitConverter.validate_input("2^-2") == (True, 0.25, None)
+
+
+def test_cache_skips_value_read_before_reset():
+    """Чтение, начавшееся до сброса ключа, не кладет в кэш устаревшее значение"""
+    cache = LRUCache(2)
+    mark = cache.mark()
+    cache.pop(1)
+    cache.set(1, "stale", mark)
+    assert cache.get(1) is None
+    cache.set(1, "fresh", cache.mark())
+    assert cache.get(1) == "fresh"
+
+
+def test_cache_stays_conservative_after_reset_eviction():
+    cache = LRUCache(1)
+    mark = cache.mark()
+    cache.pop(1)
+    cache.pop(2)  # номер сброса ключа 1 вытесняется
+    cache.set(1, "stale", mark)
+    assert cache.get(1) is None
+
+
+class FakeMessage:
+    def __init__(self, text, replies):
+        self.text = text
+        self._replies = replies
+
+    async def reply_text(self, text, **kwargs):
+        self._replies.append(text)
+
+
+def test_double_tap_saves_favorite_once(tmp_path, monkeypatch):
+    """Повторное нажатие до записи очереди не сохраняет избранное второй раз"""
+    monkeypatch.setattr(bot.BotConfig, "DB_PATH", str(tmp_path / "bot.db"))
+    replies = []
+    context = types.SimpleNamespace(user_data={})
+
+    async def scenario():
+        handlers = AdvancedBotHandlers()
+        session = handlers.get_user_session(context)
+        session.last_conversion = ConversionResult(
+            value=1.0, unit_from="метр (м)", unit_to="сантиметр (см)",
+            result=100.0, category="Длина", timestamp=datetime.now()
+        )
+        for _ in range(2):
+            update = types.SimpleNamespace(
+                message=FakeMessage("⭐ Сохранить в избранное", replies),
+                effective_user=types.SimpleNamespace(id=1)
+            )
+            await handlers.handle_after_conversion(update, context)
+        await handlers.post_shutdown(None)
+        return handlers.db.get_user_favorites(1)
+
+    favorites = asyncio.run(scenario())
+    assert len(favorites) == 1
+    assert replies[0].startswith("✅") and replies[1].startswith("❌")
+
+
+ABSOLUTE_ZERO = {
+    "Цельсий (°C)": -273.15,
+    "Фаренгейт (°F)": -459.67,
+    "Кельвин (K)": 0.0,
+    "Ранкин (°R)": 0.0,
+    "Реомюр (°Ré)": -218.52,
+}
+
+
+def test_absolute_zero_converts_from_every_scale():
+    """Абсолютный ноль в любой шкале не отклоняется из-за погрешности округления"""
+    for from_unit, value in ABSOLUTE_ZERO.items():
+        for to_unit, expected in ABSOLUTE_ZERO.items():
+            result = EnhancedUnitConverter.convert_temperature(value, from_unit, to_unit)
+            assert abs(result - expected) < 1e-9
+        assert EnhancedUnitConverter.convert_temperature(value, from_unit, "Кельвин (K)") >= 0
+
+
+def test_below_absolute_zero_is_rejected():
+    with pytest.raises(ValueError):
+        EnhancedUnitConverter.convert_temperature(-1.0, "Кельвин (K)", "Цельсий (°C)")
+
+
+def test_quick_keyboard_matches_quick_conversions():
+    """Кнопки быстрых конвертаций строятся из того же списка, что и маршрутизация"""
+    buttons = [button.text for row in bot.QUICK_ACTIONS_KEYBOARD.keyboard for button in row]
+    assert buttons == [*bot.QUICK_CONVERSION_LABELS, "🔙 Главное меню"]
+    assert set(bot.QUICK_CONVERSION_LABELS) == set(bot.QUICK_CONVERSIONS)
+
+
+@pytest.mark.parametrize("text", ["1" + "0" * 101, "1e101", "1e+101", "1e300/1", "1" + "0" * 101 + "/1", "10^101"])
+def test_too_large_number_rejected_on_every_path(text):
+    """Число, дробь и выражение проходят одну проверку пределов"""
+    assert EnhancedUnitConverter.validate_input(text) == (False, None, "❌ Слишком большое число")
+
+
+@pytest.mark.parametrize("text", ["0." + "0" * 100 + "1", "1e-200", "1/1" + "0" * 101])
+def test_too_small_number_rejected_on_every_path(text):
+    assert EnhancedUnitConverter.validate_input(text) == (False, None, "❌ Слишком маленькое число")
+
+
+class FakeApplication:
+    def __init__(self, user_data):
+        self.user_data = user_data
+
+    def drop_user_data(self, user_id):
+        self.user_data.pop(user_id, None)
+
+
+def sweep(user_data):
+    application = FakeApplication(user_data)
+    asyncio.run(AdvancedBotHandlers.sweep_sessions(types.SimpleNamespace(application=application)))
+    return application.user_data
+
+
+def test_sweep_keeps_sessions_idle_for_a_few_minutes():
+    """Сессия не удаляется посреди диалога после нескольких минут бездействия"""
+    now = time.time()
+    user_data = sweep({
+        1: {"session": bot.UserSession(last_activity=now - 600)},
+        2: {"session": bot.UserSession(last_activity=now - bot.BotConfig.SESSION_IDLE_TTL - 1)},
+    })
+    assert "session" in user_data[1]
+    assert "session" not in user_data.get(2, {})
+
+
+def make_update(update_id, text, application):
+    """Текстовое сообщение от одного пользователя в личном чате"""
+    message = {
+        "message_id": update_id, "date": 0, "text": text,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return Update.de_json({"update_id": update_id, "message": message}, application.bot)
+
+
+def test_idle_conversation_ends_with_its_session(tmp_path, monkeypatch):
+    """После очистки сессии следующее сообщение не попадает в брошенный шаг диалога"""
+    monkeypatch.setattr(bot.BotConfig, "DB_PATH", str(tmp_path / "bot.db"))
+    monkeypatch.setattr(bot.BotConfig, "SESSION_IDLE_TTL", 0.2)
+    sent = []
+
+    async def fake_post(self, endpoint, data, **kwargs):
+        if endpoint == "getMe":
+            return {"id": 999, "is_bot": True, "first_name": "Bot", "username": "test_bot"}
+        sent.append(data.get("text"))
+        return {"message_id": len(sent), "date": 0, "chat": {"id": 1, "type": "private"}}
+
+    monkeypatch.setattr(ExtBot, "_do_post", fake_post)
+
+    async def scenario():
+        application = (
+            Application.builder().token("123456:test")
+            .persistence(PicklePersistence(str(tmp_path / "sessions.pickle")))
+            .build()
+        )
+        handlers = AdvancedBotHandlers()
+        bot.register_handlers(application, handlers)
+        async with application:
+            await application.start()
+            for update_id, text in enumerate(
+                    ["🔄 Конвертировать", "Длина", "дюйм (in)", "сантиметр (см)"], start=1):
+                await application.process_update(make_update(update_id, text, application))
+            await asyncio.sleep(0.5)
+            await AdvancedBotHandlers.sweep_sessions(types.SimpleNamespace(application=application))
+            sent.clear()
+            await application.process_update(make_update(10, "10", application))
+            await application.stop()
+        await handlers.post_shutdown(application)
+
+    asyncio.run(scenario())
+    assert sent and not any("Ошибка сессии" in text for text in sent)
+
+
+def test_sweep_drops_whole_user_entries_and_caps_their_number(monkeypatch):
+    """Очистка удаляет записи пользователей целиком и держит их число в пределах MAX_SESSIONS"""
+    monkeypatch.setattr(bot.BotConfig, "MAX_SESSIONS", 2)
+    now = time.time()
+    user_data = sweep({
+        1: {"session": bot.UserSession(last_activity=now - bot.BotConfig.SESSION_IDLE_TTL - 1)},
+        2: {},
+        3: {"session": bot.UserSession(last_activity=now - 30)},
+        4: {"session": bot.UserSession(last_activity=now - 20)},
+        5: {"session": bot.UserSession(last_activity=now - 10)},
+    })
+    assert sorted(user_data) == [4, 5]
+
+
+def test_commands_route_by_name(tmp_path, monkeypatch):
+    """Один обработчик команд выбирает метод по имени, в том числе с @имя_бота"""
+    monkeypatch.setattr(bot.BotConfig, "DB_PATH", str(tmp_path / "bot.db"))
+    handlers = AdvancedBotHandlers()
+    assert sorted(handlers.commands) == ["favorites", "help", "history", "start", "stats"]
+    replies = []
+    update = types.SimpleNamespace(message=FakeMessage("/help@test_bot", replies))
+    asyncio.run(handlers.handle_command(update, types.SimpleNamespace(user_data={})))
+    assert replies == [bot.HELP_TEXT]
+
+
+def test_save_favorites_skips_duplicate_names(tmp_path, monkeypatch):
+    """Повторное имя избранного не создает вторую запись и не ломает пачку"""
+    monkeypatch.setattr(bot.BotConfig, "DB_PATH", str(tmp_path / "bot.db"))
+    db = bot.AdvancedDatabaseManager()
+    favorite = (1, "метр (м) → сантиметр (см)", "метр (м)", "сантиметр (см)", "Длина")
+    db.save_favorites([favorite])
+    db.save_favorites([favorite, (1, "фут (ft) → метр (м)", "фут (ft)", "метр (м)", "Длина")])
+    names = [row["favorite_name"] for row in db.get_user_favorites(1)]
+    assert sorted(names) == sorted([favorite[1], "фут (ft) → метр (м)"])
+
+
+def test_queued_favorites_are_written_in_one_batch(tmp_path, monkeypatch):
+    """Избранное пишется фоновой задачей одной пачкой и дописывается при остановке"""
+    monkeypatch.setattr(bot.BotConfig, "DB_PATH", str(tmp_path / "bot.db"))
+
+    async def scenario():
+        handlers = AdvancedBotHandlers()
+        batches = []
+        save_favorites = handlers.db.save_favorites
+        monkeypatch.setattr(handlers.db, "save_favorites",
+                            lambda batch: (batches.append(len(batch)), save_favorites(batch)))
+        for name in ("a", "b", "c"):
+            handlers.queue_favorite(1, name, "метр (м)", "сантиметр (см)", "Длина")
+        assert handlers.db.get_user_favorites(1) == []
+        await handlers.post_shutdown(None)
+        return batches, handlers.db.get_user_favorites(1)
+
+    batches, favorites = asyncio.run(scenario())
+    assert batches == [3]
+    assert sorted(row["favorite_name"] for row in favorites) == ["a", "b", "c"]
+
+
+def make_conversion(value=1.0):
+    return ConversionResult(value=value, unit_from="метр (м)", unit_to="сантиметр (см)",
+                            result=value * 100, category="Длина", timestamp=datetime.now())
+
+
+def test_stats_counters_follow_history_and_favorites(tmp_path, monkeypatch):
+    """Счетчики user_stats ведутся триггерами при записи истории и избранного"""
+    monkeypatch.setattr(bot.BotConfig, "DB_PATH", str(tmp_path / "bot.db"))
+    db = bot.AdvancedDatabaseManager()
+    db.save_conversions([(1, make_conversion(1.0)), (1, make_conversion(2.0))])
+    db.save_favorites([(1, "м → см", "метр (м)", "сантиметр (см)", "Длина")])
+    stats = db.get_user_stats(1)
+    assert stats["conversions_count"] == 2
+    assert stats["favorites_count"] == 1
+
+
+def test_queued_history_is_flushed_and_counted(tmp_path, monkeypatch):
+    """История пишется фоновыми пачками; избранное, записанное раньше истории, тоже учитывается"""
+    monkeypatch.setattr(bot.BotConfig, "DB_PATH", str(tmp_path / "bot.db"))
+
+    async def scenario():
+        handlers = AdvancedBotHandlers()
+        handlers.queue_favorite(1, "м → см", "метр (м)", "сантиметр (см)", "Длина")
+        await asyncio.sleep(bot.BotConfig.FAVORITES_FLUSH_DELAY * 4)
+        handlers.queue_conversion(1, make_conversion(1.0))
+        handlers.queue_conversion(1, make_conversion(2.0))
+        await handlers.post_shutdown(None)
+        return handlers.db.get_recent_conversions(1), handlers.db.get_user_stats(1)
+
+    recent, stats = asyncio.run(scenario())
+    assert sorted(row["from_value"] for row in recent) == [1.0, 2.0]
+    assert stats["conversions_count"] == 2 and stats["favorites_count"] == 1
+
+
+@pytest.mark.parametrize("text, expected", [("2*(3+4)", 14.0), ("sqrt(16)+sin(0)", 4.0), ("pi/pi", 1.0)])
+def test_expressions_evaluate_allowed_elements(text, expected):
+    assert EnhancedUnitConverter.validate_input(text) == (True, expected, None)
+
+
+@pytest.mark.parametrize("text", ["__import__('os').getcwd()", "(1).real", "open('x')", "[1][0]"])
+def test_expressions_reject_anything_outside_the_allowlist(text):
+    """Разбор выражений не выполняет произвольный код, в отличие от eval"""
+    is_valid, value, _ = EnhancedUnitConverter.validate_input(text)
+    assert not is_valid and value is None
+
+
+@pytest.mark.parametrize("value, from_unit, to_unit, category, expected", [
+    (10, "дюйм (in)", "сантиметр (см)", "Длина", 25.4),
+    (1, "фунт (lb)", "килограмм (кг)", "Масса", 0.453592),
+    (1, "вершок", "метр (м)", "Длина", 0.04445),
+    (1, "метр (м)", "вершок", "Древнерусские меры длины", 1 / 0.04445),
+])
+def test_linear_conversions_use_pair_factors(value, from_unit, to_unit, category, expected):
+    """Предвычисленные множители пар дают те же результаты, что и пересчет через базовую единицу"""
+    result = EnhancedUnitConverter.convert_standard(value, from_unit, to_unit, category)
+    assert result == pytest.approx(expected, rel=1e-12)
+
+
+@pytest.mark.parametrize("value, expected", [(1234567.891, "1 234 567.89"), (100.0, "100"), (25.4, "25.4"), (-40.0, "-40")])
+def test_format_result_groups_thousands_and_trims_zeros(value, expected):
+    assert EnhancedUnitConverter.format_result(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [(1.5e-07, "1.50000000e-7"), (1e20, "1.00000000e+20")])
+def test_format_result_strips_the_exponent_leading_zero(value, expected):
+    assert EnhancedUnitConverter.format_result(value) == expected
+
+
+def test_start_escapes_markdown_in_the_user_name(tmp_path, monkeypatch):
+    """Символы разметки в имени пользователя не ломают приветствие"""
+    monkeypatch.setattr(bot.BotConfig, "DB_PATH", str(tmp_path / "bot.db"))
+    replies = []
+    update = types.SimpleNamespace(message=FakeMessage("/start", replies),
+                                   effective_user=types.SimpleNamespace(id=1, first_name="Иван_*"))
+    asyncio.run(AdvancedBotHandlers().start(update, types.SimpleNamespace(user_data={})))
+    assert "Иван\\_\\*" in replies[0]
+
+
+def test_cleanup_deletes_old_history_in_chunks(tmp_path, monkeypatch):
+    """Старая история удаляется порциями до конца, свежая остается"""
+    monkeypatch.setattr(bot.BotConfig, "DB_PATH", str(tmp_path / "bot.db"))
+    monkeypatch.setattr(bot.BotConfig, "CLEANUP_CHUNK_SIZE", 2)
+    db = bot.AdvancedDatabaseManager()
+    db.save_conversions([(1, make_conversion(float(value))) for value in range(6)])
+    with db.get_db_connection() as conn:
+        conn.execute("UPDATE conversion_history SET converted_at = datetime('now', '-40 days') WHERE from_value < 5")
+    db.cleanup_old_history(30)
+    assert [row["from_value"] for row in db.get_recent_conversions(1)] == [5.0]
+
+
+def test_sessions_survive_a_restart_through_pickle_persistence(tmp_path):
+    """Сессия с последней конвертацией восстанавливается из файла после перезапуска"""
+    path = str(tmp_path / "sessions.pickle")
+    session = bot.UserSession(last_activity=time.time(), category="Длина",
+                              unit_from="метр (м)", unit_to="сантиметр (см)",
+                              last_conversion=make_conversion(3.0))
+
+    async def scenario():
+        persistence = PicklePersistence(path)
+        await persistence.update_user_data(1, {"session": session})
+        await persistence.flush()
+        return (await PicklePersistence(path).get_user_data())[1]["session"]
+
+    assert asyncio.run(scenario()) == session